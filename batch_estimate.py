@@ -0,0 +1,231 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import common.api
+from common.api import PRICE_PER_SQUARE_METER_PATH, call_backend
+from common.config import backend_url
+from common.query_params import QUERY_PARAM_NAMES, normalize_query_params, query_params_to_filter, read_filters
+from common.statistics import summarize_prices, transaction_count
+
+RESULT_FIELDS = (
+    "row",
+    *QUERY_PARAM_NAMES,
+    "sample_size",
+    "mean",
+    "median",
+    "q25",
+    "q75",
+    "min",
+    "max",
+    "error",
+)
+
+# Like the estimation page, statistics need more than 4 transactions
+MIN_SAMPLE_SIZE = 5
+
+
+def _init_worker():
+    # Estimates must reflect the backend now: no stale responses from the shared disk cache of the app,
+    # and batch queries do not fill it either
+    common.api.disk_cache = None
+
+
+def estimate(task):
+    # Any failure, from an unreadable input line to an unexpected backend response, fails only its own row
+    row_number, row, read_error, api_url, widen_narrow_ranges = task
+    if read_error:
+        return {"row": row_number, "error": read_error}
+    if not isinstance(row, dict):
+        return {"row": row_number, "error": f"Expected an object of query parameters, got {type(row).__name__}"}
+
+    query_params = normalize_query_params(row)
+    result = {"row": row_number, **query_params}
+    try:
+        return _estimate(result, query_params, api_url, widen_narrow_ranges)
+    except Exception as e:
+        result["error"] = f"Estimation failed: {type(e).__name__}: {e}"
+        return result
+
+
+def _estimate(result, query_params, api_url, widen_narrow_ranges):
+    # A malformed number, e.g. start_year=abc, is reported as invalid query parameters
+    try:
+        query_filter, error = query_params_to_filter(query_params, widen_narrow_ranges=widen_narrow_ranges)
+    except ValueError as e:
+        error = f"Invalid query parameters: {e}"
+    if error:
+        result["error"] = error
+        return result
+
+    response_data, error = call_backend(api_url, {"where_clause": query_filter.to_where_clause()}, allow_stale=False)
+    if error:
+        result["error"] = error
+        return result
+
+    transactions = response_data["transactions"]
+    sample_size = transaction_count(transactions)
+    result["sample_size"] = sample_size
+    if sample_size < MIN_SAMPLE_SIZE:
+        result["error"] = f"Only {sample_size} matching transactions"
+        return result
+
+    summary = summarize_prices(
+        response_data["min_prices_per_square_meter"], response_data["max_prices_per_square_meter"], transactions
+    )
+    result.update(
+        mean=summary.mean,
+        median=summary.median,
+        q25=summary.q25,
+        q75=summary.q75,
+        min=summary.min,
+        max=summary.max,
+    )
+    return result
+
+
+class JsonlWriter:
+    def __init__(self, output_file):
+        self.output_file = output_file
+
+    def write(self, result: dict):
+        self.output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.output_file.flush()
+
+
+class CsvWriter:
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.writer = csv.DictWriter(output_file, fieldnames=RESULT_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, result: dict):
+        self.writer.writerow(result)
+
+    def close(self):
+        self.output_file.flush()
+
+
+class ParquetWriter:
+    # Buffers a bounded number of rows and writes them out as one row group at a time
+    BATCH_SIZE = 10000
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as parquet
+        except ImportError:
+            raise SystemExit("Writing Parquet requires pyarrow: pip install pyarrow")
+
+        self.pa = pa
+        self.schema = pa.schema(
+            [("row", pa.int64())]
+            + [(name, pa.string()) for name in QUERY_PARAM_NAMES]
+            + [("sample_size", pa.int64())]
+            + [(name, pa.float64()) for name in ("mean", "median", "q25", "q75", "min", "max")]
+            + [("error", pa.string())]
+        )
+        self.writer = parquet.ParquetWriter(path, self.schema)
+        self.rows = []
+
+    def write(self, result: dict):
+        self.rows.append(result)
+        if len(self.rows) >= self.BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self.rows:
+            columns = {name: [row.get(name) for row in self.rows] for name in RESULT_FIELDS}
+            self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+def open_writer(path: str, output_format: str):
+    if output_format == "parquet":
+        return ParquetWriter(path)
+
+    output_file = sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+    return CsvWriter(output_file) if output_format == "csv" else JsonlWriter(output_file)
+
+
+def run(args):
+    api_url = f"{args.backend_url.rstrip('/')}{PRICE_PER_SQUARE_METER_PATH}"
+    output_format = args.format or os.path.splitext(args.output)[1].lstrip(".") or "jsonl"
+    if output_format not in ("jsonl", "csv", "parquet"):
+        raise SystemExit(f"Unsupported output format: {output_format}")
+
+    writer = open_writer(args.output, output_format)
+    tasks = (
+        (row_number, row, read_error, api_url, args.widen_narrow_ranges)
+        for row_number, (row, read_error) in enumerate(read_filters(args.input), start=1)
+    )
+
+    started = time.perf_counter()
+    last_report = started
+    completed = 0
+    failed = 0
+    # At most max_in_flight filters are queued at once, and results are written in input order
+    # as soon as they are ready, so memory stays flat however large the input is
+    max_in_flight = args.workers * 4
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        for task in tasks:
+            in_flight.append(pool.submit(estimate, task))
+            while len(in_flight) >= max_in_flight or (in_flight and in_flight[0].done()):
+                result = in_flight.popleft().result()
+                writer.write(result)
+                completed += 1
+                failed += bool(result.get("error"))
+
+            if time.perf_counter() - last_report >= args.progress_interval:
+                last_report = time.perf_counter()
+                elapsed = last_report - started
+                print(f"{completed} filters in {elapsed:.1f} s ({completed / elapsed:.1f}/s)", file=sys.stderr)
+
+        while in_flight:
+            result = in_flight.popleft().result()
+            writer.write(result)
+            completed += 1
+            failed += bool(result.get("error"))
+
+    writer.close()
+    elapsed = time.perf_counter() - started
+    print(
+        f"Estimated {completed} filters ({failed} without a result) in {elapsed:.1f} s, "
+        f"{completed / elapsed if elapsed else 0:.1f} filters/s with {args.workers} workers",
+        file=sys.stderr,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Estimate the price per square meter for many filters. Each input row uses the query "
+        "parameters of the estimation page: " + ", ".join(QUERY_PARAM_NAMES) + ".",
+    )
+    parser.add_argument("input", help="CSV or JSONL file of filters, or - for JSONL on stdin")
+    parser.add_argument("-o", "--output", default="-", help="Output file (.jsonl, .csv or .parquet), or - for stdout")
+    parser.add_argument("--format", choices=("jsonl", "csv", "parquet"), help="Output format, by default from the output extension")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--backend-url", default=backend_url, help="Base URL of the valuation backend")
+    parser.add_argument(
+        "--widen-narrow-ranges",
+        action="store_true",
+        help="Widen very narrow year and square meter ranges, like the estimation page does",
+    )
+    parser.add_argument("--progress-interval", type=float, default=10, help="Seconds between progress reports")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,341 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import common.api
+from common.api import PRICE_PER_SQUARE_METER_PATH, PROPERTY_VALUATION_PATH, response_cache
+from common.config import local_snapshot_path
+from common.figure_cache import figure_cache
+from common.filters import process_postal_codes
+from common.http_client import post_json
+from common.statistics import (
+    SUMMARY_BIN_WIDTH,
+    price_histogram,
+    price_midpoints,
+    summarize_histogram,
+    summarize_prices,
+)
+from common.synthetic import generate_transactions
+from local_backend import create_server
+import estimate_square_meter_price.helpers as estimate_helpers
+import property_valuation.helpers as valuation_helpers
+
+DEFAULT_SIZES = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+# create_distplot evaluates an exact KDE, which is impractically slow for large samples
+DISTPLOT_MAX_ROWS = 20_000
+
+# Imported in a fresh interpreter after streamlit, which every page pays for anyway.
+# Importing streamlit_app also runs the welcome page in bare mode, a proxy for its first paint
+IMPORT_TARGETS = (
+    "streamlit_app",
+    "experimental.experimental",
+    "estimate_square_meter_price.get_price_per_square_meter_estimates",
+    "property_valuation.property_valuation_tab",
+    "plotly.figure_factory",
+)
+
+IMPORT_TIMER = """
+import importlib, sys, time
+import streamlit
+started = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print((time.perf_counter() - started) * 1000)
+"""
+
+FILTER_ARGUMENTS = (
+    "00100, 00120, 02100",
+    (1965, 1985),
+    (25, 85),
+    ["helsinki", "espoo"],
+    ["oma"],
+    ["Kaksiot", "Kolmiot"],
+    ["kt"],
+    ["hyvä"],
+    process_postal_codes,
+)
+
+
+class StubEngine:
+    # Answers every request with canned responses, so call_api times only transport and decoding
+    def __init__(self):
+        self.responses = {}
+
+    def handle(self, endpoint_path: str, payload: dict):
+        if payload.get("mode") == "summary":
+            return self.responses["summary"], None
+        return self.responses[endpoint_path], None
+
+
+def prepare_case(rows: int, seed: int):
+    # Backend responses with the given number of transaction rows, and the inputs each stage needs
+    data = generate_transactions(rows, seed)
+    min_prices = data["min_price_per_square_meter"]
+    max_prices = data["max_price_per_square_meter"]
+    transactions = data["transactions"]
+    summary = summarize_prices(min_prices, max_prices, transactions)
+    prices = data["price"]
+    return {
+        "rows": rows,
+        "estimate_response": {
+            "min_prices_per_square_meter": min_prices,
+            "max_prices_per_square_meter": max_prices,
+            "transactions": transactions,
+        },
+        "summary_response": price_histogram(price_midpoints(min_prices, max_prices), transactions),
+        "valuation_response": {
+            "mean": float(prices.mean()),
+            "standard_deviation": float(prices.std()),
+            "sample_size": rows,
+        },
+        "summary": summary,
+        "midpoints": list(summary.midpoints),
+    }
+
+
+def _call_uncached(call_api, **payload):
+    # Every repeat must reach the stub backend, not the response cache
+    def run(case):
+        response_cache.clear()
+        call_api({"where_clause": ["benchmark", str(case["rows"])], **payload})
+
+    return run
+
+
+def _build_kde_figure(case):
+    figure_cache.clear()
+    estimate_helpers.build_kde_figure(case["summary"])
+
+
+def _create_distplot(case):
+    import plotly.figure_factory as ff
+
+    if case["rows"] > DISTPLOT_MAX_ROWS:
+        return False
+    ff.create_distplot([case["midpoints"]], [""], show_hist=False, show_rug=False)
+
+
+def _plot_normal_distribution(case):
+    response = case["valuation_response"]
+    valuation_helpers.plot_normal_distribution(response["mean"], response["standard_deviation"], response["sample_size"])
+
+
+STAGES = {
+    "estimate.build_where_clause": lambda case: estimate_helpers.build_where_clause(*FILTER_ARGUMENTS),
+    "estimate.call_api": _call_uncached(lambda payload: estimate_helpers.call_api(payload)),
+    # The same request without the binary columnar format, for comparison
+    "estimate.call_api_json": _call_uncached(lambda payload: post_json(estimate_helpers.api_url, payload)),
+    # Mode "summary": a histogram instead of every transaction
+    "estimate.call_api_summary": _call_uncached(
+        lambda payload: estimate_helpers.call_api(payload), mode="summary", bin_width=SUMMARY_BIN_WIDTH
+    ),
+    "estimate.summarize_histogram": lambda case: summarize_histogram(case["summary_response"]),
+    "estimate.summarize_prices": lambda case: summarize_prices(
+        case["estimate_response"]["min_prices_per_square_meter"],
+        case["estimate_response"]["max_prices_per_square_meter"],
+        case["estimate_response"]["transactions"],
+    ),
+    "estimate.build_kde_figure": _build_kde_figure,
+    "estimate.create_distplot": _create_distplot,
+    "estimate.display_kde_plot_cached": lambda case: estimate_helpers.display_kde_plot(
+        None, None, f"benchmark-{case['rows']}", case["summary"]
+    ),
+    "valuation.build_where_clause": lambda case: valuation_helpers.build_where_clause(*FILTER_ARGUMENTS),
+    "valuation.call_api": _call_uncached(lambda payload: valuation_helpers.call_api(payload)),
+    "valuation.build_normal_distribution_figure": lambda case: valuation_helpers.build_normal_distribution_figure(
+        case["valuation_response"]["mean"],
+        case["valuation_response"]["standard_deviation"],
+        case["valuation_response"]["sample_size"],
+    ),
+    "valuation.plot_normal_distribution": _plot_normal_distribution,
+}
+
+
+def time_stage(stage, case, repeats: int, min_seconds: float):
+    # One untimed warmup, then at least `repeats` runs and at least `min_seconds` in total
+    if stage(case) is False:
+        return None
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeats or (time.perf_counter() - started < min_seconds and len(timings) < 1000):
+        run_started = time.perf_counter()
+        stage(case)
+        timings.append((time.perf_counter() - run_started) * 1000)
+    return {
+        "runs": len(timings),
+        "min_ms": min(timings),
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+        "max_ms": max(timings),
+    }
+
+
+def time_import(module: str, repeats: int):
+    # Each run is a cold import in a new interpreter, so nothing is shared with the other runs
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings = []
+    for _ in range(repeats):
+        completed = subprocess.run(
+            [sys.executable, "-c", IMPORT_TIMER, module],
+            cwd=project_root,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        timings.append(float(completed.stdout.strip().splitlines()[-1]))
+    return {
+        "runs": len(timings),
+        "min_ms": min(timings),
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+        "max_ms": max(timings),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    if local_snapshot_path:
+        raise SystemExit("Unset LOCAL_SNAPSHOT_PATH: the benchmarks time call_api against a stub backend")
+
+    engine = StubEngine()
+    server = create_server(engine, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    backend = f"http://127.0.0.1:{server.server_address[1]}"
+    estimate_helpers.api_url = f"{backend}{PRICE_PER_SQUARE_METER_PATH}"
+    valuation_helpers.api_url = f"{backend}{PROPERTY_VALUATION_PATH}"
+
+    def selected(name):
+        return not args.stages or any(part in name for part in args.stages)
+
+    stages = {name: stage for name, stage in STAGES.items() if selected(name)}
+    results = []
+    # Import times do not depend on the result size, so they are recorded with 0 rows
+    for module in IMPORT_TARGETS:
+        name = f"import.{module}"
+        if args.imports and selected(name):
+            timing = time_import(module, args.repeats)
+            results.append({"stage": name, "rows": 0, **timing})
+            print(f"{name:<38} {'cold':>9}       {timing['median_ms']:>10.3f} ms median", file=sys.stderr)
+
+    try:
+        for rows in args.sizes:
+            case = prepare_case(rows, args.seed)
+            engine.responses[PRICE_PER_SQUARE_METER_PATH] = case["estimate_response"]
+            engine.responses[PROPERTY_VALUATION_PATH] = case["valuation_response"]
+            engine.responses["summary"] = case["summary_response"]
+            for name, stage in stages.items():
+                timing = time_stage(stage, case, args.repeats, args.min_seconds)
+                if timing is None:
+                    continue
+                results.append({"stage": name, "rows": rows, **timing})
+                print(f"{name:<38} {rows:>9} rows  {timing['median_ms']:>10.3f} ms median", file=sys.stderr)
+    finally:
+        server.shutdown()
+
+    return {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "sizes": list(args.sizes),
+            "repeats": args.repeats,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float, min_difference_ms: float):
+    # Median time of each stage and size against the baseline; returns the regressions.
+    # Sub-millisecond stages are noisy, so a regression must also be min_difference_ms slower
+    baseline_timings = {(result["stage"], result["rows"]): result["median_ms"] for result in baseline["results"]}
+    regressions = []
+    print(f"{'stage':<38} {'rows':>9} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for result in report["results"]:
+        key = (result["stage"], result["rows"])
+        if key not in baseline_timings:
+            continue
+        before, after = baseline_timings[key], result["median_ms"]
+        change = after / before - 1 if before else 0.0
+        regressed = change > max_regression and after - before > min_difference_ms
+        if regressed:
+            regressions.append({**result, "baseline_median_ms": before, "change": change})
+        print(f"{key[0]:<38} {key[1]:>9} {before:>12.3f} {after:>12.3f} {change:>+8.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time each stage of the estimation and valuation paths across result sizes.",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(float(size)) for size in value.split(",")],
+        default=list(DEFAULT_SIZES),
+        help="Comma separated numbers of transaction rows, by default " + ",".join(map(str, DEFAULT_SIZES)),
+    )
+    parser.add_argument("--stages", nargs="*", help="Only run stages whose name contains one of these")
+    parser.add_argument("--repeats", type=int, default=5, help="Minimum timed runs per stage and size")
+    parser.add_argument("--min-seconds", type=float, default=0.2, help="Minimum timed seconds per stage and size")
+    parser.add_argument(
+        "--no-imports",
+        dest="imports",
+        action="store_false",
+        help="Skip the cold import time measurements",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic responses")
+    parser.add_argument("-o", "--output", default="benchmark-results.json", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare the results to this earlier results file")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.25,
+        help="Fail when a median time is this much slower than the baseline (0.25 = 25%%)",
+    )
+    parser.add_argument(
+        "--min-difference-ms",
+        type=float,
+        default=1.0,
+        help="Ignore slowdowns smaller than this many milliseconds",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    # Streamlit warns about the missing script run context on every chart outside `streamlit run`
+    logging.disable(logging.WARNING)
+    # Every repeat must reach the stub backend, and benchmark queries must not land in the shared disk cache
+    common.api.disk_cache = None
+    args = parse_args()
+    report = run(args)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(
+                report, json.load(baseline_file), args.max_regression, args.min_difference_ms
+            )
+        if regressions:
+            print(f"{len(regressions)} stages regressed by more than {args.max_regression:.0%}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from common.cache import TTLCache
+from common.config import (
+    binary_responses,
+    dataset_version,
+    disk_cache_max_mb,
+    disk_cache_path,
+    disk_cache_ttl_seconds,
+    summary_bin_width,
+    summary_responses,
+    response_cache_max_entries,
+    response_cache_ttl_seconds,
+    stale_while_revalidate_seconds,
+    local_snapshot_path,
+    local_sketch_cube,
+)
+from common.disk_cache import DiskCache
+from common.filters import Filter, FilterError
+from common.http_client import post_columns, post_json
+from common.single_flight import SingleFlight
+
+PRICE_PER_SQUARE_METER_PATH = "/get-price-per-square-meters/"
+PROPERTY_VALUATION_PATH = "/property-price-valuation/"
+
+# Refreshing stale responses only waits on the backend, a couple of threads are plenty
+REVALIDATION_WORKERS = 2
+
+logger = logging.getLogger(__name__)
+
+# Process-wide cache of successful backend responses, shared by every tab
+response_cache = TTLCache(response_cache_max_entries, response_cache_ttl_seconds, stale_while_revalidate_seconds)
+
+# Identical queries already on their way to the backend are shared instead of sent again
+in_flight_requests = SingleFlight()
+
+
+def _dataset_version():
+    # A local snapshot stamps its own version; the remote backend's data is versioned with DATASET_VERSION
+    if local_snapshot_path:
+        from common.local_engine import snapshot_version
+
+        return f"{dataset_version}|{snapshot_version(local_snapshot_path)}"
+    return dataset_version
+
+
+# Second level below response_cache: survives restarts and is shared by the worker processes of the host
+disk_cache = (
+    DiskCache(disk_cache_path, int(disk_cache_max_mb * 1024 * 1024), disk_cache_ttl_seconds, _dataset_version())
+    if disk_cache_path
+    else None
+)
+
+
+def price_query_payload(where_clause):
+    # Payload for the price per square meter endpoint, asking for a histogram when summary responses are on
+    if summary_responses:
+        return {"where_clause": where_clause, "mode": "summary", "bin_width": summary_bin_width}
+    return {"where_clause": where_clause}
+
+
+def payload_fingerprint(api_url: str, payload: dict):
+    # Equivalent where clauses share the canonical fingerprint of their filter
+    canonical_payload = dict(payload)
+    if "where_clause" in canonical_payload:
+        try:
+            canonical_payload["where_clause"] = Filter.from_where_clause(canonical_payload["where_clause"]).fingerprint()
+        except FilterError:
+            canonical_payload["where_clause"] = sorted(canonical_payload["where_clause"])
+
+    canonical = json.dumps([api_url, canonical_payload], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def fetch(api_url: str, payload: dict):
+    # In local mode the snapshot answers the query in-process, without a network hop
+    if local_snapshot_path:
+        from common.local_engine import get_local_engine
+
+        return get_local_engine(local_snapshot_path, local_sketch_cube).handle(urlsplit(api_url).path, payload)
+    # Price lists decode straight into NumPy arrays when the backend offers the binary format
+    if binary_responses and urlsplit(api_url).path == PRICE_PER_SQUARE_METER_PATH:
+        return post_columns(api_url, payload)
+    return post_json(api_url, payload)
+
+
+def _lookup(key: str):
+    # (response, age in seconds, stale) from memory, else from what earlier processes left in the disk cache
+    entry = response_cache.get_entry(key)
+    if entry is not None or disk_cache is None:
+        return entry
+
+    disk_entry = disk_cache.get_entry(key)
+    if disk_entry is None:
+        return None
+    response_data, age = disk_entry
+    if age > response_cache_ttl_seconds + stale_while_revalidate_seconds:
+        return None
+    response_cache.put(key, response_data, age=age)
+    return response_data, age, age > response_cache_ttl_seconds
+
+
+def _fetch_and_cache(key: str, api_url: str, payload: dict):
+    # The previous single-flight leader for this key may have cached the response since the caller's lookup,
+    # which already counted the miss
+    response_data = response_cache.peek(key)
+    if response_data is not None:
+        return response_data, None
+    return _fetch_and_store(key, api_url, payload)
+
+
+def _fetch_and_store(key: str, api_url: str, payload: dict):
+    response_data, error = fetch(api_url, payload)
+    if error is None:
+        response_cache.put(key, response_data)
+        if disk_cache is not None:
+            disk_cache.put(key, response_data)
+    return response_data, error
+
+
+# Stale responses are refreshed on a small pool, at most once at a time per query
+_revalidation_pool = None
+_revalidating = set()
+_revalidation_lock = threading.Lock()
+revalidation_counts = {"started": 0, "failed": 0}
+
+
+def _revalidate(key: str, api_url: str, payload: dict):
+    global _revalidation_pool
+    with _revalidation_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+        revalidation_counts["started"] += 1
+        if _revalidation_pool is None:
+            _revalidation_pool = ThreadPoolExecutor(max_workers=REVALIDATION_WORKERS, thread_name_prefix="revalidate")
+    _revalidation_pool.submit(_run_revalidation, key, api_url, payload)
+
+
+def _run_revalidation(key: str, api_url: str, payload: dict):
+    try:
+        _, error = in_flight_requests.do(key, lambda: _fetch_and_cache(key, api_url, payload))
+    except Exception as e:
+        error = str(e)
+    finally:
+        with _revalidation_lock:
+            _revalidating.discard(key)
+    # The stale response keeps being served until a refresh succeeds
+    if error is not None:
+        with _revalidation_lock:
+            revalidation_counts["failed"] += 1
+        logger.info("Refreshing a stale response failed: %s", error)
+
+
+_last_fetch = threading.local()
+
+
+def last_fetch():
+    # When the data of the last call_backend answer on this thread was fetched, and whether it was stale
+    return getattr(_last_fetch, "info", None)
+
+
+def is_stale(info):
+    # Served stale, or expired since it was fetched
+    return info["stale"] or time.time() - info["fetched_at"] > response_cache_ttl_seconds
+
+
+def describe_freshness(info):
+    if info is None:
+        return ""
+    age = max(0.0, time.time() - info["fetched_at"])
+    if age < 60:
+        text = "Data retrieved just now"
+    elif age < 60 * 60:
+        text = f"Data retrieved {age / 60:.0f} min ago"
+    else:
+        text = f"Data retrieved {age / 3600:.1f} h ago"
+    if info["stale"]:
+        text += ", served from the cache while a fresh copy is fetched in the background"
+    return text
+
+
+# Call a backend endpoint, answering repeated queries from the response cache
+# and coalescing concurrent identical queries into a single request.
+# Expired responses are answered at once, marked as stale, and refreshed in the background,
+# unless allow_stale is off and they are fetched again before answering
+def call_backend(api_url: str, payload: dict, allow_stale: bool = True):
+    key = payload_fingerprint(api_url, payload)
+    entry = _lookup(key)
+    if entry is not None and (allow_stale or not entry[2]):
+        response_data, age, stale = entry
+        if stale:
+            _revalidate(key, api_url, payload)
+        _last_fetch.info = {"fetched_at": time.time() - age, "stale": stale}
+        return response_data, None
+
+    response_data, error = in_flight_requests.do(key, lambda: _fetch_and_cache(key, api_url, payload))
+    _last_fetch.info = None if error else {"fetched_at": time.time(), "stale": False}
+    return response_data, error
+
+
+# Fetch and cache a response even when a fresh one is cached, to keep popular queries from expiring.
+# A response another worker stored in the disk cache less than max_age ago is loaded instead
+def refresh_backend(api_url: str, payload: dict, max_age=None):
+    key = payload_fingerprint(api_url, payload)
+    if max_age is not None and disk_cache is not None:
+        entry = disk_cache.get_entry(key)
+        if entry is not None and entry[1] < max_age:
+            response_cache.put(key, entry[0], age=entry[1])
+            return entry[0], None
+    return in_flight_requests.do(key, lambda: _fetch_and_store(key, api_url, payload))
+
+
+def cache_stats():
+    return response_cache.stats()
+
+
+def disk_cache_stats():
+    return disk_cache.stats() if disk_cache is not None else None
+
+
+def coalescing_stats():
+    return in_flight_requests.stats()
+
+
+def revalidation_stats():
+    with _revalidation_lock:
+        return {"in_flight": len(_revalidating), **revalidation_counts}
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    # Thread-safe LRU cache with a size bound and an optional time-to-live per entry.
+    # Expired entries are kept stale_seconds longer for get_entry, which serves them marked as stale
+    def __init__(self, max_entries: int, ttl_seconds=None, stale_seconds: float = 0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, stored_at = entry
+            if self._expired(key, time.monotonic() - stored_at):
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        # Like get for a fresh entry, without counting the lookup or touching the LRU order
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                return default
+            return value
+
+    def get_entry(self, key):
+        # (value, age in seconds, stale) for fresh and stale entries, None otherwise
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            stale = self._expired(key, age)
+            if stale and key not in self._entries:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return value, age, stale
+
+    def _expired(self, key, age: float):
+        # Past the time-to-live, and dropped once past the stale period too
+        if self.ttl_seconds is None or age <= self.ttl_seconds:
+            return False
+        if age > self.ttl_seconds + self.stale_seconds:
+            del self._entries[key]
+            self.expirations += 1
+        return True
+
+    def put(self, key, value, age: float = 0.0):
+        # age backdates entries that were fetched earlier, for example by another process
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() - age)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale_hits": self.stale_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
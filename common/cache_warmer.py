@@ -0,0 +1,158 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.config import (
+    backend_url,
+    cache_warm,
+    cache_warm_delay_seconds,
+    cache_warm_interval_seconds,
+    cache_warm_queries_file,
+    cache_warm_workers,
+)
+from common.query_params import (
+    CITY_OPTIONS,
+    ROOM_NUMBER_OPTIONS,
+    normalize_query_params,
+    query_params_to_filter,
+    read_filters,
+)
+
+logger = logging.getLogger(__name__)
+
+# Ranges the estimation page opens with
+DEFAULT_WARM_RANGES = {"start_year": "1965", "end_year": "1985", "min_m2": "25", "max_m2": "85"}
+# Disk cache lease electing the one worker process of the host that warms the shared cache
+WARMER_LEASE = "cache-warmer"
+
+_stats_lock = threading.Lock()
+_stats = {
+    "runs": 0,
+    "standby_runs": 0,
+    "queries": 0,
+    "warmed": 0,
+    "failed": 0,
+    "last_run_at": None,
+    "last_duration_seconds": None,
+}
+
+
+def default_warm_queries():
+    # Every city of the estimation page with each room category, at the page's default ranges
+    return [
+        {**DEFAULT_WARM_RANGES, "cities": city, "room_numbers": room_number}
+        for city in CITY_OPTIONS
+        for room_number in ROOM_NUMBER_OPTIONS
+    ]
+
+
+def load_warm_queries(path=None):
+    if not path:
+        return default_warm_queries()
+    queries = []
+    for row_number, (row, error) in enumerate(read_filters(path), start=1):
+        if error is None and not isinstance(row, dict):
+            error = f"expected an object of query parameters, got {type(row).__name__}"
+        if error:
+            logger.warning("Skipping cache warm query %d of %s: %s", row_number, path, error)
+            continue
+        queries.append(normalize_query_params(row))
+    return queries
+
+
+def warm_query(api_url: str, query_params: dict):
+    # Returns the error, None once the response is cached
+    from common.api import price_query_payload, refresh_backend
+
+    # A malformed number, e.g. start_year=19x5, fails only its own query
+    try:
+        query_filter, error = query_params_to_filter(query_params)
+    except ValueError as e:
+        return f"Invalid query parameters: {e}"
+    if error:
+        return error
+    # Queries another worker or a visitor fetched within the interval are not sent again
+    max_age = cache_warm_interval_seconds or None
+    _, error = refresh_backend(api_url, price_query_payload(query_filter.to_where_clause()), max_age=max_age)
+    return error
+
+
+def warm_cache(queries, api_url=None, max_workers: int = cache_warm_workers):
+    # Fetch every query into the response cache on a bounded pool, so the backend sees at most max_workers of them at once
+    from common.api import PRICE_PER_SQUARE_METER_PATH
+
+    api_url = api_url or f"{backend_url}{PRICE_PER_SQUARE_METER_PATH}"
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cache-warm") as pool:
+        errors = list(pool.map(lambda query_params: warm_query(api_url, query_params), queries))
+    duration = time.perf_counter() - started
+
+    failed = sum(error is not None for error in errors)
+    with _stats_lock:
+        _stats.update(
+            runs=_stats["runs"] + 1,
+            queries=len(queries),
+            warmed=len(queries) - failed,
+            failed=failed,
+            last_run_at=time.time(),
+            last_duration_seconds=duration,
+        )
+    logger.info("Warmed %d of %d popular queries in %.2f s", len(queries) - failed, len(queries), duration)
+    if failed:
+        logger.warning("Warming failed for %d queries, e.g. %s", failed, next(error for error in errors if error))
+    return cache_warmer_stats()
+
+
+def cache_warmer_stats():
+    with _stats_lock:
+        coverage = _stats["warmed"] / _stats["queries"] if _stats["queries"] else 0.0
+        return {**_stats, "coverage": coverage}
+
+
+def _elected(lease_seconds: float):
+    # With a shared disk cache one worker process warms it for every worker, the others load from it
+    from common.api import disk_cache
+
+    if disk_cache is None or disk_cache.acquire_lease(WARMER_LEASE, lease_seconds):
+        return True
+    with _stats_lock:
+        _stats["standby_runs"] += 1
+    return False
+
+
+_warmer_lock = threading.Lock()
+_warmer_started = False
+
+
+# Warm the cache in the background after cache_warm_delay_seconds, so it does not compete with the first
+# page loads, and then every cache_warm_interval_seconds.
+# Streamlit reruns the app script on every interaction, so only the first call starts anything
+def start_cache_warmer():
+    global _warmer_started
+    with _warmer_lock:
+        if _warmer_started or not cache_warm:
+            return
+        _warmer_started = True
+
+    def warm_periodically():
+        time.sleep(cache_warm_delay_seconds)
+        try:
+            queries = load_warm_queries(cache_warm_queries_file)
+        except (OSError, ValueError) as error:
+            logger.warning("Could not read the cache warm queries from %s: %s", cache_warm_queries_file, error)
+            return
+
+        # The lease outlives one interval, so another worker takes over only once the warming one is gone
+        lease_seconds = 1.5 * max(cache_warm_interval_seconds, 60)
+        while True:
+            try:
+                if _elected(lease_seconds):
+                    warm_cache(queries)
+            except Exception:
+                logger.exception("Warming the cache failed")
+            if not cache_warm_interval_seconds:
+                return
+            time.sleep(cache_warm_interval_seconds)
+
+    threading.Thread(target=warm_periodically, name="cache-warmer", daemon=True).start()
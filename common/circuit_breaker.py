@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    # Opens once at least failure_rate of the calls in the last window_seconds failed (and there were
+    # min_calls of them), rejecting calls for open_seconds. Then a single probe call is let through:
+    # its success closes the circuit again, its failure keeps it open for another open_seconds
+    def __init__(self, failure_rate: float = 0.5, min_calls: int = 5, window_seconds: float = 30, open_seconds: float = 15):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque()
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success: bool):
+        with self._lock:
+            now = time.monotonic()
+            if success:
+                self.successes += 1
+            else:
+                self.failures += 1
+
+            if self.state == HALF_OPEN:
+                if success:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open(now)
+                return
+
+            self._outcomes.append((now, success))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._outcomes.popleft()
+            if self.state == CLOSED and len(self._outcomes) >= self.min_calls and self._failure_share() >= self.failure_rate:
+                self._open(now)
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        self._probing = False
+        self.opened += 1
+
+    def _failure_share(self):
+        failures = sum(1 for _, success in self._outcomes if not success)
+        return failures / len(self._outcomes) if self._outcomes else 0.0
+
+    def retry_in(self):
+        # Seconds until the next probe is let through, 0 when calls are allowed
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "failure_share": self._failure_share(),
+                "successes": self.successes,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "opened": self.opened,
+            }
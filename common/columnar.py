@@ -0,0 +1,75 @@
+import json
+import struct
+
+import numpy as np
+
+# Binary response format for column-shaped responses: raw little-endian arrays after a small JSON header,
+# so clients can decode them with np.frombuffer instead of parsing JSON
+COLUMNAR_MEDIA_TYPE = "application/vnd.finland-real-estate.columns"
+
+# Magic, format version, header length
+_PREAMBLE = struct.Struct("<4sHxxI")
+_MAGIC = b"COLS"
+_VERSION = 1
+_ALIGNMENT = 8
+_SUPPORTED_KINDS = "iuf"
+
+
+class ColumnarFormatError(ValueError):
+    pass
+
+
+def _padding(length: int):
+    return -length % _ALIGNMENT
+
+
+def is_columnar(response_data):
+    # Only responses made entirely of one-dimensional columns can be sent in this format
+    return bool(response_data) and all(
+        isinstance(value, (list, np.ndarray)) and np.ndim(value) == 1 for value in response_data.values()
+    )
+
+
+def encode_columns(columns: dict):
+    arrays = {}
+    for name, values in columns.items():
+        array = np.asarray(values)
+        if array.dtype.kind not in _SUPPORTED_KINDS:
+            raise ColumnarFormatError(f"Column {name} has unsupported dtype {array.dtype}")
+        arrays[name] = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+
+    layout = []
+    offset = 0
+    for name, array in arrays.items():
+        layout.append({"name": name, "dtype": array.dtype.str, "length": len(array), "offset": offset})
+        offset += array.nbytes + _padding(array.nbytes)
+
+    header = json.dumps({"columns": layout}, separators=(",", ":")).encode("utf-8")
+    header += b" " * _padding(_PREAMBLE.size + len(header))
+    parts = [_PREAMBLE.pack(_MAGIC, _VERSION, len(header)), header]
+    for array in arrays.values():
+        parts.append(array.tobytes())
+        parts.append(b"\0" * _padding(array.nbytes))
+    return b"".join(parts)
+
+
+# Decode without copying: every column is a read-only NumPy view into the body
+def decode_columns(body: bytes):
+    if len(body) < _PREAMBLE.size:
+        raise ColumnarFormatError("Columnar body is truncated")
+    magic, version, header_length = _PREAMBLE.unpack_from(body)
+    if magic != _MAGIC or version != _VERSION:
+        raise ColumnarFormatError(f"Not a version {_VERSION} columnar body")
+
+    data_start = _PREAMBLE.size + header_length
+    try:
+        layout = json.loads(body[_PREAMBLE.size:data_start])["columns"]
+        columns = {}
+        for column in layout:
+            dtype = np.dtype(column["dtype"])
+            columns[column["name"]] = np.frombuffer(
+                body, dtype=dtype, count=column["length"], offset=data_start + column["offset"]
+            )
+    except (KeyError, TypeError, ValueError) as error:
+        raise ColumnarFormatError(f"Malformed columnar body: {error}")
+    return columns
@@ -0,0 +1,93 @@
+import os
+
+
+def _env_int(name: str, default: int):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+# In-memory response cache shared by every call_api in the process
+response_cache_max_entries = _env_int("RESPONSE_CACHE_MAX_ENTRIES", 512)
+response_cache_ttl_seconds = _env_float("RESPONSE_CACHE_TTL_SECONDS", 15 * 60)
+
+# HTTP client used for every backend call
+http_connect_timeout_seconds = _env_float("HTTP_CONNECT_TIMEOUT_SECONDS", 3.05)
+http_read_timeout_seconds = _env_float("HTTP_READ_TIMEOUT_SECONDS", 20)
+http_max_retries = _env_int("HTTP_MAX_RETRIES", 2)
+http_retry_backoff_seconds = _env_float("HTTP_RETRY_BACKOFF_SECONDS", 0.25)
+http_retry_budget_seconds = _env_float("HTTP_RETRY_BUDGET_SECONDS", 30)
+http_pool_size = _env_int("HTTP_POOL_SIZE", 10)
+
+# Connection pool size per endpoint path, overriding http_pool_size
+http_endpoint_pool_sizes = {
+    "/get-price-per-square-meters/": _env_int("HTTP_POOL_SIZE_PRICE_PER_SQUARE_METER", 20),
+    "/property-price-valuation/": _env_int("HTTP_POOL_SIZE_PROPERTY_VALUATION", http_pool_size),
+}
+
+# Answer backend queries in-process from a columnar snapshot (.npz, .parquet or .arrow) instead of over HTTP
+local_snapshot_path = os.environ.get("LOCAL_SNAPSHOT_PATH") or None
+# Also pre-aggregate the local snapshot into per-cell quantile sketches, which answer summary mode queries
+local_sketch_cube = os.environ.get("LOCAL_SKETCH_CUBE", "").lower() in ("1", "true", "yes")
+
+# Samples up to this size use scipy's exact Gaussian KDE, larger ones the binned FFT estimator
+kde_exact_max_samples = _env_int("KDE_EXACT_MAX_SAMPLES", 2000)
+
+# Built Plotly figures kept for reuse across reruns and sessions
+figure_cache_max_entries = _env_int("FIGURE_CACHE_MAX_ENTRIES", 128)
+
+# Ask the price per square meter endpoint for binary columns instead of JSON (JSON is still accepted)
+binary_responses = os.environ.get("BINARY_RESPONSES", "1").lower() not in ("0", "false", "no")
+
+# Ask for a histogram of the price per square meter instead of every transaction (mode "summary"),
+# with bins of this many euros; backends without the mode still answer with every transaction
+summary_responses = os.environ.get("SUMMARY_RESPONSES", "1").lower() not in ("0", "false", "no")
+summary_bin_width = _env_float("SUMMARY_BIN_WIDTH", 10)
+
+# Responses are also kept in a SQLite file that survives restarts and is shared by worker processes.
+# An empty DISK_CACHE_PATH turns it off. Entries of other DATASET_VERSIONs are ignored
+disk_cache_path = os.environ.get("DISK_CACHE_PATH", ".cache/responses.sqlite3") or None
+disk_cache_max_mb = _env_float("DISK_CACHE_MAX_MB", 256)
+disk_cache_ttl_seconds = _env_float("DISK_CACHE_TTL_SECONDS", 24 * 60 * 60)
+dataset_version = os.environ.get("DATASET_VERSION", "")
+
+# Responses older than the response cache TTL are still served for this long, marked as stale,
+# while a fresh copy is fetched in the background. 0 fetches expired responses before answering
+stale_while_revalidate_seconds = _env_float("STALE_WHILE_REVALIDATE_SECONDS", 24 * 60 * 60)
+
+# Fail fast while the backend host fails this share of its requests in the window, probing it again
+# every CIRCUIT_OPEN_SECONDS
+circuit_failure_rate = _env_float("CIRCUIT_FAILURE_RATE", 0.5)
+circuit_min_requests = _env_int("CIRCUIT_MIN_REQUESTS", 5)
+circuit_window_seconds = _env_float("CIRCUIT_WINDOW_SECONDS", 30)
+circuit_open_seconds = _env_float("CIRCUIT_OPEN_SECONDS", 15)
+
+# Opt in to fetching popular queries into the response cache CACHE_WARM_DELAY_SECONDS after startup and
+# then every CACHE_WARM_INTERVAL_SECONDS (0 only once). The queries come from CACHE_WARM_QUERIES_FILE (CSV or
+# JSONL of estimation page query parameters), by default every city and room category at the page's default ranges
+cache_warm = os.environ.get("CACHE_WARM", "").lower() in ("1", "true", "yes")
+cache_warm_queries_file = os.environ.get("CACHE_WARM_QUERIES_FILE") or None
+cache_warm_delay_seconds = _env_float("CACHE_WARM_DELAY_SECONDS", 10)
+cache_warm_interval_seconds = _env_float("CACHE_WARM_INTERVAL_SECONDS", 10 * 60)
+cache_warm_workers = _env_int("CACHE_WARM_WORKERS", 4)
+
+# Base URL of the valuation backend
+backend_url = os.environ.get("BACKEND_URL", "http://51.20.64.222:8000").rstrip("/")
+
+# Export stage timing histograms in the Prometheus text format to a file and/or a local /metrics endpoint
+metrics_file = os.environ.get("METRICS_FILE") or None
+metrics_port = _env_int("METRICS_PORT", 0)
+metrics_export_interval_seconds = _env_float("METRICS_EXPORT_INTERVAL_SECONDS", 15)
+
+# Profile every rerun of the estimation pages with cProfile. ?profile=1 profiles a single page, but only where
+# PROFILE_QUERY_PARAM opts in, since every profiled run writes a file on the server
+profile_reruns = os.environ.get("PROFILE_RERUNS", "").lower() in ("1", "true", "yes")
+profile_query_param = os.environ.get("PROFILE_QUERY_PARAM", "").lower() in ("1", "true", "yes")
+profile_dir = os.environ.get("PROFILE_DIR", "profiles")
+# Only the newest profile files are kept, 0 keeps all of them
+profile_max_files = _env_int("PROFILE_MAX_FILES", 50)
+profile_top_n = _env_int("PROFILE_TOP_N", 25)
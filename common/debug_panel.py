@@ -0,0 +1,110 @@
+import streamlit as st
+
+from common.config import local_snapshot_path, metrics_export_interval_seconds, metrics_file, metrics_port
+from common.instrumentation import prometheus_text, stage_summaries, start_metrics_export
+
+
+def debug_enabled():
+    return st.query_params.get("debug", "").lower() in ("1", "true", "yes")
+
+
+def app_metrics():
+    # Imported here so the welcome page can show the panel without loading the HTTP client and NumPy
+    from common.api import cache_stats, coalescing_stats, disk_cache_stats, revalidation_stats
+    from common.cache_warmer import cache_warmer_stats
+    from common.figure_cache import figure_cache_stats
+    from common.http_client import circuit_breaker_stats
+
+    response_cache = cache_stats()
+    figures = figure_cache_stats()
+    coalescing = coalescing_stats()
+    disk = disk_cache_stats()
+    revalidations = revalidation_stats()
+    breakers = circuit_breaker_stats().values()
+    warmer = cache_warmer_stats()
+    metrics = {
+        "app_response_cache_entries": ("gauge", "Backend responses in the response cache", response_cache["entries"]),
+        "app_response_cache_hits_total": ("counter", "Response cache hits", response_cache["hits"]),
+        "app_response_cache_misses_total": ("counter", "Response cache misses", response_cache["misses"]),
+        "app_response_cache_stale_hits_total": (
+            "counter", "Expired responses served while they were refreshed", response_cache["stale_hits"]
+        ),
+        "app_revalidations_total": ("counter", "Background refreshes of stale responses", revalidations["started"]),
+        "app_revalidation_failures_total": ("counter", "Background refreshes that failed", revalidations["failed"]),
+        "app_circuits_open": (
+            "gauge", "Backend hosts currently failed fast", sum(breaker["state"] != "closed" for breaker in breakers)
+        ),
+        "app_circuit_rejected_total": (
+            "counter", "Backend requests failed fast by an open circuit", sum(breaker["rejected"] for breaker in breakers)
+        ),
+        "app_cache_warm_runs_total": ("counter", "Completed cache warm-up runs", warmer["runs"]),
+        "app_cache_warm_standby_runs_total": (
+            "counter", "Warm-up runs left to the worker process holding the warmer lease", warmer["standby_runs"]
+        ),
+        "app_cache_warm_queries": ("gauge", "Popular queries warmed by each run", warmer["queries"]),
+        "app_cache_warm_coverage": ("gauge", "Share of those queries cached by the last run", warmer["coverage"]),
+        "app_cache_warm_duration_seconds": (
+            "gauge", "Duration of the last cache warm-up run", warmer["last_duration_seconds"] or 0.0
+        ),
+        "app_figure_cache_entries": ("gauge", "Figures in the figure cache", figures["entries"]),
+        "app_figure_cache_hits_total": ("counter", "Figure cache hits", figures["hits"]),
+        "app_figure_builds_total": ("counter", "Figures built", figures["builds"]),
+        "app_backend_requests_total": ("counter", "Backend requests sent", coalescing["executed"]),
+        "app_backend_requests_coalesced_total": (
+            "counter", "Requests answered by an identical request already in flight", coalescing["coalesced"]
+        ),
+    }
+    if disk is not None:
+        metrics.update({
+            "app_disk_cache_entries": ("gauge", "Responses in the disk cache for the current dataset version", disk["entries"]),
+            "app_disk_cache_bytes": ("gauge", "Size of those responses in bytes", disk["bytes"]),
+            "app_disk_cache_hits_total": ("counter", "Disk cache hits", disk["hits"]),
+            "app_disk_cache_misses_total": ("counter", "Disk cache misses", disk["misses"]),
+            "app_disk_cache_evictions_total": ("counter", "Disk cache evictions", disk["evictions"]),
+        })
+    if local_snapshot_path:
+        from common.local_engine import local_engine_stats
+
+        engine = local_engine_stats()
+        if engine is not None:
+            metrics.update({
+                "app_local_rows": ("gauge", "Transaction rows in the local snapshot", engine["rows"]),
+                "app_local_snapshot_load_seconds": ("gauge", "Time to load the local snapshot", engine["load_seconds"]),
+                "app_local_index_build_seconds": (
+                    "gauge", "Time to build the local snapshot's indexes", engine["index_build_seconds"]
+                ),
+            })
+            if engine["sketch_cube_build_seconds"] is not None:
+                metrics["app_local_sketch_cube_build_seconds"] = (
+                    "gauge", "Time to pre-aggregate the local snapshot into the sketch cube", engine["sketch_cube_build_seconds"]
+                )
+    return metrics
+
+
+def app_metrics_text():
+    return prometheus_text(app_metrics())
+
+
+def start_app_metrics_export():
+    start_metrics_export(app_metrics_text, metrics_file, metrics_port, metrics_export_interval_seconds)
+
+
+# Stage timings of every session in this process, only shown with ?debug=1 in the URL
+def render_debug_panel(key: str):
+    if not debug_enabled():
+        return
+
+    with st.expander("Debug: stage timings", expanded=True):
+        summaries = stage_summaries()
+        if summaries:
+            st.dataframe(summaries, use_container_width=True)
+        else:
+            st.write("Nothing has been timed yet.")
+        st.json({name: value for name, (_, _, value) in app_metrics().items()}, expanded=False)
+        st.download_button(
+            "Download Prometheus metrics",
+            app_metrics_text(),
+            file_name="metrics.prom",
+            mime="text/plain",
+            key=f"{key}-debug-metrics",
+        )
@@ -0,0 +1,269 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from common.columnar import decode_columns, encode_columns, is_columnar
+
+logger = logging.getLogger(__name__)
+
+# Every dataset version has its own copy of a key, so processes on different versions during a rolling
+# deploy do not overwrite each other's entries. Files of an older schema are emptied and recreated
+_SCHEMA_VERSION = 3
+_SCHEMA = (
+    "DROP TABLE IF EXISTS entries",
+    "DROP TABLE IF EXISTS leases",
+    """
+    CREATE TABLE entries (
+        key TEXT NOT NULL,
+        version TEXT NOT NULL,
+        stored_at REAL NOT NULL,
+        accessed_at REAL NOT NULL,
+        size INTEGER NOT NULL,
+        value BLOB NOT NULL,
+        PRIMARY KEY (key, version)
+    )
+    """,
+    "CREATE INDEX entries_accessed_at ON entries (accessed_at)",
+    "CREATE TABLE leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)",
+    f"PRAGMA user_version = {_SCHEMA_VERSION}",
+)
+
+# Reads only refresh the access time this rarely, so hot entries do not turn every hit into a write
+_ACCESS_RESOLUTION_SECONDS = 60
+# Eviction trims the cache to this share of its size bound, so it does not run on every write
+_EVICTION_TARGET = 0.9
+# After a failed open, e.g. "database is locked" or a read-only disk, the next attempt waits this long,
+# doubling up to the maximum while the failures go on
+_REOPEN_BACKOFF_SECONDS = 1.0
+_REOPEN_BACKOFF_MAX_SECONDS = 60.0
+
+
+def encode_response(response_data):
+    # Column responses keep their NumPy columns in the binary columnar format, anything else is JSON
+    if is_columnar(response_data):
+        return b"C" + encode_columns(response_data)
+    return b"J" + json.dumps(response_data, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+
+def decode_response(blob: bytes):
+    if blob[:1] == b"C":
+        return decode_columns(blob[1:])
+    return json.loads(blob[1:])
+
+
+def _json_default(value):
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class DiskCache:
+    # SQLite-backed cache that outlives the process and is shared by every worker process on the host.
+    # Entries stored under another dataset version are misses, and the least recently used entries
+    # are evicted once the values take more than max_bytes
+    def __init__(self, path: str, max_bytes: int, ttl_seconds=None, version: str = ""):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.version = version
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._reopen_at = 0.0
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._open_failures = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _unavailable(self):
+        # Skipped until the backoff after a failed open has passed
+        return getattr(self._local, "connection", None) is None and time.monotonic() < self._reopen_at
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # One connection per thread; SQLite locking and WAL make writers in other processes safe
+                connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    if connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                        for statement in _SCHEMA:
+                            connection.execute(statement)
+                    connection.execute("COMMIT")
+                except sqlite3.Error:
+                    connection.execute("ROLLBACK")
+                    raise
+            except (sqlite3.Error, OSError) as error:
+                with self._lock:
+                    self._open_failures += 1
+                    backoff = min(_REOPEN_BACKOFF_SECONDS * 2 ** (self._open_failures - 1), _REOPEN_BACKOFF_MAX_SECONDS)
+                    self._reopen_at = time.monotonic() + backoff
+                log = logger.warning if self._open_failures == 1 else logger.debug
+                log("Disk cache %s is unavailable, retrying in %.0f s: %s", self.path, backoff, error)
+                raise
+            with self._lock:
+                self._open_failures = 0
+            self._local.connection = connection
+        return connection
+
+    def _failed(self, error):
+        # A failed read or write, e.g. a lock held too long by another process, is a miss, never a page error
+        with self._lock:
+            self.errors += 1
+        logger.debug("Disk cache %s operation failed: %s", self.path, error)
+
+    def get(self, key, default=None):
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def get_entry(self, key):
+        # (value, age in seconds) of an entry of this dataset version, None otherwise.
+        # Entries of other versions are left to eviction, another process may still be using them
+        if self._unavailable():
+            return None
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT stored_at, accessed_at, value FROM entries WHERE key = ? AND version = ?", (key, self.version)
+            ).fetchone()
+            now = time.time()
+            expired = row is not None and self.ttl_seconds is not None and now - row[0] > self.ttl_seconds
+            if row is None or expired:
+                if expired:
+                    connection.execute("DELETE FROM entries WHERE key = ? AND version = ?", (key, self.version))
+                with self._lock:
+                    self.misses += 1
+                return None
+
+            if now - row[1] > _ACCESS_RESOLUTION_SECONDS:
+                connection.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ? AND version = ?", (now, key, self.version)
+                )
+            value = decode_response(row[2])
+        except (sqlite3.Error, OSError, ValueError) as error:
+            self._failed(error)
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return value, now - row[0]
+
+    def put(self, key, value):
+        if self._unavailable():
+            return
+        try:
+            blob = encode_response(value)
+            if len(blob) > self.max_bytes:
+                return
+            now = time.time()
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, version, stored_at, accessed_at, size, value) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, self.version, now, now, len(blob), blob),
+            )
+            with self._lock:
+                self.writes += 1
+            self._evict(connection)
+        except (sqlite3.Error, OSError, TypeError, ValueError) as error:
+            self._failed(error)
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Entries of other dataset versions go first, then the least recently used ones
+        target = self.max_bytes * _EVICTION_TARGET
+        evicted = 0
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT key, version, size FROM entries ORDER BY version = ?, accessed_at", (self.version,)
+            )
+            keys = []
+            for key, version, size in rows:
+                if total <= target:
+                    break
+                keys.append((key, version))
+                total -= size
+            connection.executemany("DELETE FROM entries WHERE key = ? AND version = ?", keys)
+            evicted = len(keys)
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.evictions += evicted
+
+    def acquire_lease(self, name: str, seconds: float):
+        # True when this cache holds the named lease for the next seconds, renewing its own lease.
+        # Lets the worker processes sharing the file elect one of them for a job
+        if self._unavailable():
+            return False
+        try:
+            connection = self._connection()
+            now = time.time()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+                acquired = row is None or row[0] == self._owner or row[1] <= now
+                if acquired:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                        (name, self._owner, now + seconds),
+                    )
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+        except (sqlite3.Error, OSError) as error:
+            self._failed(error)
+            return False
+        return acquired
+
+    def clear(self):
+        if self._unavailable():
+            return
+        try:
+            self._connection().execute("DELETE FROM entries")
+        except (sqlite3.Error, OSError) as error:
+            self._failed(error)
+
+    def stats(self):
+        entries, size = 0, 0
+        if not self._unavailable():
+            try:
+                entries, size = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE version = ?", (self.version,)
+                ).fetchone()
+            except (sqlite3.Error, OSError):
+                pass
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "version": self.version,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
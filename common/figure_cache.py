@@ -0,0 +1,55 @@
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+from common.cache import TTLCache
+from common.config import figure_cache_max_entries
+
+# Figures are only read after they are built (st.plotly_chart serializes them), so sessions can share them
+figure_cache = TTLCache(figure_cache_max_entries)
+
+_build_lock = threading.Lock()
+_builds = 0
+_build_seconds = 0.0
+
+
+def array_fingerprint(*arrays):
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        if array is None:
+            digest.update(b"none")
+            continue
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        digest.update(len(array).to_bytes(8, "little"))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+# Return the figure built for this variant and data, building it on the first request only
+def cached_figure(variant: str, data_key, build):
+    key = (variant, data_key)
+    fig = figure_cache.get(key)
+    if fig is not None:
+        return fig
+
+    global _builds, _build_seconds
+    started = time.perf_counter()
+    fig = build()
+    elapsed = time.perf_counter() - started
+    with _build_lock:
+        _builds += 1
+        _build_seconds += elapsed
+
+    figure_cache.put(key, fig)
+    return fig
+
+
+def figure_cache_stats():
+    stats = figure_cache.stats()
+    with _build_lock:
+        stats["builds"] = _builds
+        stats["build_seconds_total"] = _build_seconds
+        stats["build_seconds_mean"] = _build_seconds / _builds if _builds else 0.0
+    return stats
@@ -0,0 +1,33 @@
+import streamlit as st
+
+from common.filters import build_filter
+
+
+# Where clause of the filter widgets shared by the estimation, experimental and valuation tabs
+def build_where_clause(
+    postal_codes_input_text,
+    selected_built_year_range,
+    selected_square_meter_range,
+    selected_cities,
+    selected_property_ownership_options,
+    selected_room_number_options,
+    selected_property_type_options,
+    selected_property_condition_options,
+    process_postal_codes
+):
+    query_filter, error = build_filter(
+        postal_codes_input_text,
+        selected_built_year_range,
+        selected_square_meter_range,
+        selected_cities,
+        selected_property_ownership_options,
+        selected_room_number_options,
+        selected_property_type_options,
+        selected_property_condition_options,
+        process_postal_codes,
+    )
+    # Show the postal code validation error, the filter leaves invalid postal codes out
+    if error:
+        st.error(error)
+
+    return query_filter.to_where_clause()
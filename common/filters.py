@@ -0,0 +1,254 @@
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# Spellings of the same room category in the transaction data, mapped to one canonical name
+ROOM_CATEGORY_SYNONYMS = {
+    "Yksiö": "Yksiö",
+    "Yksiöt": "Yksiö",
+    "Kaksiot": "Kaksiot",
+    "Kaksi huonetta": "Kaksiot",
+    "Kolmiot": "Kolmiot",
+    "Kolme huonetta": "Kolmiot",
+    "Neljä huonetta tai enemmän": "Neljä huonetta tai enemmän",
+}
+COLUMN_SYNONYMS = {"room_category": ROOM_CATEGORY_SYNONYMS}
+
+# Order in which build_where_clause has always emitted its fragments
+COLUMN_ORDER = (
+    "postal_code",
+    "year_built",
+    "square_meters",
+    "city",
+    "plot_ownership",
+    "room_category",
+    "building_type",
+    "state",
+)
+
+_IN_FRAGMENT = re.compile(r"^\s*(\w+)\s+in\s+\((.*)\)\s*$", re.IGNORECASE)
+_RANGE_FRAGMENT = re.compile(r"^\s*(\w+)\s*(>=|<=)\s*(-?\d+(?:\.\d+)?)\s*$")
+_QUOTED_VALUE = re.compile(r"'((?:[^']|'')*)'")
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _number(value):
+    # Query params arrive as strings; 1965, "1965" and 1965.0 are the same bound
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _quote(value: str):
+    return "'{}'".format(value.replace("'", "''"))
+
+
+@dataclass(frozen=True)
+class Range:
+    column: str
+    low: Optional[float] = None
+    high: Optional[float] = None
+
+    def conditions(self):
+        conditions = []
+        if self.low is not None:
+            conditions.append((self.column, ">=", self.low))
+        if self.high is not None:
+            conditions.append((self.column, "<=", self.high))
+        return conditions
+
+    def to_sql(self):
+        return [f"{column} {operator} {value}" for column, operator, value in self.conditions()]
+
+    def intersect(self, other: "Range"):
+        lows = [low for low in (self.low, other.low) if low is not None]
+        highs = [high for high in (self.high, other.high) if high is not None]
+        return Range(self.column, max(lows) if lows else None, min(highs) if highs else None)
+
+    def normal_form(self):
+        return ["range", self.column, self.low, self.high]
+
+
+@dataclass(frozen=True)
+class InSet:
+    column: str
+    values: Tuple[str, ...]
+
+    def expanded_values(self):
+        # Every spelling in the data that is a synonym of one of the selected values
+        synonyms = COLUMN_SYNONYMS.get(self.column, {})
+        spellings = {spelling for spelling, canonical in synonyms.items() if canonical in self.values}
+        return sorted(spellings.union(self.values))
+
+    def conditions(self):
+        return [(self.column, "in", self.expanded_values())]
+
+    def to_sql(self):
+        values = self.expanded_values()
+        if not values:
+            # Disjoint sets intersected to nothing. "in ()" is not valid SQL, while NULL never compares
+            # equal, so "in (NULL)" matches no row and parses back to this empty set
+            return [f"{self.column} in (NULL)"]
+        return ["{} in ({})".format(self.column, ", ".join(_quote(value) for value in values))]
+
+    def intersect(self, other: "InSet"):
+        return InSet(self.column, tuple(sorted(set(self.values) & set(other.values))))
+
+    def normal_form(self):
+        return ["in", self.column, list(self.values)]
+
+
+@dataclass(frozen=True)
+class And:
+    terms: Tuple = ()
+
+    def conditions(self):
+        return [condition for term in self.terms for condition in term.conditions()]
+
+    def to_sql(self):
+        return [fragment for term in self.terms for fragment in term.to_sql()]
+
+    def normal_form(self):
+        return ["and", [term.normal_form() for term in self.terms]]
+
+
+def range_filter(column: str, low=None, high=None):
+    return Range(column, _number(low) if low is not None else None, _number(high) if high is not None else None)
+
+
+def in_filter(column: str, values):
+    synonyms = COLUMN_SYNONYMS.get(column, {})
+    return InSet(column, tuple(sorted({synonyms.get(str(value), str(value)) for value in values})))
+
+
+def _sort_key(term):
+    column = term.column
+    position = COLUMN_ORDER.index(column) if column in COLUMN_ORDER else len(COLUMN_ORDER)
+    return position, column, type(term).__name__
+
+
+def _flatten(terms):
+    for term in terms:
+        if isinstance(term, And):
+            yield from _flatten(term.terms)
+        else:
+            yield term
+
+
+def conjunction(terms):
+    # Canonical conjunction: one term per column and kind, bounds and sets on the same column intersected
+    merged = {}
+    for term in _flatten(terms):
+        key = (type(term).__name__, term.column)
+        merged[key] = merged[key].intersect(term) if key in merged else term
+    return And(tuple(sorted(merged.values(), key=_sort_key)))
+
+
+class Filter:
+    # Canonical filter over the transaction columns: a conjunction of ranges and IN-sets
+    def __init__(self, terms=()):
+        self.root = conjunction(terms)
+
+    def __eq__(self, other):
+        return isinstance(other, Filter) and self.root == other.root
+
+    def __hash__(self):
+        return hash(self.root)
+
+    def __repr__(self):
+        return f"Filter({self.root.normal_form()!r})"
+
+    @property
+    def terms(self):
+        return self.root.terms
+
+    def fingerprint(self):
+        canonical = json.dumps(self.root.normal_form(), ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    # (column, operator, value) conditions for the local engine, with synonyms expanded
+    def conditions(self):
+        return self.root.conditions()
+
+    # SQL fragment list in the format the backend expects as "where_clause"
+    def to_where_clause(self):
+        return self.root.to_sql()
+
+    def to_mask(self, snapshot):
+        import numpy as np
+
+        mask = np.ones(snapshot.num_rows, dtype=bool)
+        for column, operator, value in self.conditions():
+            mask &= snapshot.condition_mask(column, operator, value)
+        return mask
+
+    @classmethod
+    def from_where_clause(cls, where_clause):
+        terms = []
+        for fragment in where_clause:
+            match = _IN_FRAGMENT.match(fragment)
+            if match:
+                values = [value.replace("''", "'") for value in _QUOTED_VALUE.findall(match.group(2))]
+                terms.append(in_filter(match.group(1), values))
+                continue
+
+            match = _RANGE_FRAGMENT.match(fragment)
+            if match:
+                column, operator, value = match.groups()
+                terms.append(range_filter(column, low=value) if operator == ">=" else range_filter(column, high=value))
+                continue
+
+            raise FilterError(f"Unsupported where clause fragment: {fragment}")
+        return cls(terms)
+
+
+def process_postal_codes(input_text):
+    # Split the input text by commas
+    postal_codes = [code.strip() for code in input_text.split(",")]
+
+    # Validate each postal code
+    for code in postal_codes:
+        if not code.isdigit() or len(code) != 5:
+            return None, f"Invalid postal code: {code}"
+
+    return postal_codes, None
+
+
+def build_filter(
+    postal_codes_input_text,
+    selected_built_year_range,
+    selected_square_meter_range,
+    selected_cities,
+    selected_property_ownership_options,
+    selected_room_number_options,
+    selected_property_type_options,
+    selected_property_condition_options,
+    process_postal_codes
+):
+    # Returns the filter and the postal code validation error, if any; invalid postal codes are left out
+    terms = []
+    error = None
+
+    if postal_codes_input_text:
+        postal_codes, error = process_postal_codes(postal_codes_input_text)
+        if not error:
+            terms.append(in_filter("postal_code", postal_codes))
+
+    terms.append(range_filter("year_built", selected_built_year_range[0], selected_built_year_range[1]))
+    terms.append(range_filter("square_meters", selected_square_meter_range[0], selected_square_meter_range[1]))
+
+    for column, selected_options in (
+        ("city", selected_cities),
+        ("plot_ownership", selected_property_ownership_options),
+        ("room_category", selected_room_number_options),
+        ("building_type", selected_property_type_options),
+        ("state", selected_property_condition_options),
+    ):
+        if selected_options:
+            terms.append(in_filter(column, selected_options))
+
+    return Filter(terms), error
@@ -0,0 +1,150 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.circuit_breaker import CircuitBreaker
+from common.columnar import COLUMNAR_MEDIA_TYPE, ColumnarFormatError, decode_columns
+from common.config import (
+    circuit_failure_rate,
+    circuit_min_requests,
+    circuit_open_seconds,
+    circuit_window_seconds,
+    http_connect_timeout_seconds,
+    http_read_timeout_seconds,
+    http_max_retries,
+    http_retry_backoff_seconds,
+    http_retry_budget_seconds,
+    http_pool_size,
+    http_endpoint_pool_sizes,
+)
+
+# Responses worth retrying: the backend is overloaded or restarting
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+_mounted_endpoints = set()
+_circuit_breakers = {}
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=http_pool_size, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _session_for(api_url: str):
+    session = _get_session()
+    if api_url in _mounted_endpoints:
+        return session
+
+    # Give each endpoint its own keep-alive pool so one slow endpoint cannot starve another
+    with _session_lock:
+        if api_url not in _mounted_endpoints:
+            pool_size = http_endpoint_pool_sizes.get(urlsplit(api_url).path, http_pool_size)
+            session.mount(api_url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0))
+            _mounted_endpoints.add(api_url)
+    return session
+
+
+def _circuit_breaker_for(api_url: str):
+    # One breaker per backend host, as every endpoint of a host fails together
+    host = urlsplit(api_url).netloc
+    breaker = _circuit_breakers.get(host)
+    if breaker is None:
+        with _session_lock:
+            breaker = _circuit_breakers.setdefault(
+                host,
+                CircuitBreaker(circuit_failure_rate, circuit_min_requests, circuit_window_seconds, circuit_open_seconds),
+            )
+    return breaker
+
+
+def circuit_breaker_stats():
+    return {host: breaker.stats() for host, breaker in list(_circuit_breakers.items())}
+
+
+def _backoff_seconds(attempt: int):
+    # Exponential backoff with full jitter, so retrying sessions do not stampede the backend together
+    return random.uniform(0, http_retry_backoff_seconds * (2 ** attempt))
+
+
+def post(api_url: str, payload: dict, headers=None):
+    breaker = _circuit_breaker_for(api_url)
+    if not breaker.allow():
+        raise requests.exceptions.ConnectionError(
+            f"Backend {urlsplit(api_url).netloc} is failing, not calling it again for {breaker.retry_in():.0f} s"
+        )
+
+    # Only connection errors, timeouts and overload responses count against the backend, not bad requests
+    healthy = True
+    try:
+        response = _post_with_retries(api_url, payload, headers)
+        healthy = response.status_code < 500 and response.status_code not in RETRYABLE_STATUS_CODES
+        return response
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        healthy = False
+        raise
+    finally:
+        breaker.record(healthy)
+
+
+def _post_with_retries(api_url: str, payload: dict, headers=None):
+    session = _session_for(api_url)
+    timeout = (http_connect_timeout_seconds, http_read_timeout_seconds)
+    deadline = time.monotonic() + http_retry_budget_seconds
+
+    attempt = 0
+    while True:
+        try:
+            response = session.post(api_url, json=payload, headers=headers, timeout=timeout)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                return response
+            error = requests.exceptions.HTTPError(f"{response.status_code} Server Error for url: {api_url}", response=response)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+
+        delay = _backoff_seconds(attempt)
+        if attempt >= http_max_retries or time.monotonic() + delay > deadline:
+            if isinstance(error, requests.exceptions.HTTPError):
+                return error.response
+            raise error
+
+        time.sleep(delay)
+        attempt += 1
+
+
+def post_json(api_url: str, payload: dict):
+    try:
+        response = post(api_url, payload)
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        return response.json(), None
+    except requests.exceptions.RequestException as e:
+        return None, str(e)
+
+
+# Ask for the binary columnar format, falling back to JSON for servers that do not offer it.
+# requests already negotiates gzip (and zstd when zstandard is installed) and decompresses transparently
+COLUMNAR_ACCEPT = f"{COLUMNAR_MEDIA_TYPE}, application/json;q=0.5"
+
+
+def post_columns(api_url: str, payload: dict):
+    try:
+        response = post(api_url, payload, headers={"Accept": COLUMNAR_ACCEPT})
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        if response.headers.get("Content-Type", "").startswith(COLUMNAR_MEDIA_TYPE):
+            return decode_columns(response.content), None
+        return response.json(), None
+    except (requests.exceptions.RequestException, ColumnarFormatError) as e:
+        return None, str(e)
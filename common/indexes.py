@@ -0,0 +1,170 @@
+import logging
+import math
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Columns with at most this many distinct values also get one dense bitmap per value
+DENSE_BITMAP_MAX_CARDINALITY = 64
+# When the most selective condition matches fewer than num_rows / SELECTIVE_FRACTION rows,
+# the other conditions are checked on those rows only instead of combining full bitmaps
+SELECTIVE_FRACTION = 16
+
+
+class TransactionIndex:
+    # Posting lists and bitmap indexes over the categorical columns, sorted-array indexes over the numeric ones.
+    # Bitmaps are packed 8 rows per byte so AND/OR touch an eighth of the memory of boolean masks.
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.num_rows = snapshot.num_rows
+        # Row ids grouped by category code, with offsets: the rows of code c are order[bounds[c]:bounds[c + 1]]
+        self.category_order = {}
+        self.category_bounds = {}
+        self.bitmaps = {}
+        self.sorted_values = {}
+        self.sort_order = {}
+        self.build_seconds = 0.0
+
+    @classmethod
+    def build(cls, snapshot, numeric_columns):
+        started = time.perf_counter()
+        index = cls(snapshot)
+
+        for column, categories in snapshot.categories.items():
+            codes = snapshot.columns[column]
+            order = np.argsort(codes, kind="stable").astype(np.int32)
+            bounds = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+            index.category_order[column] = order
+            index.category_bounds[column] = bounds
+            if len(categories) <= DENSE_BITMAP_MAX_CARDINALITY:
+                index.bitmaps[column] = [
+                    index._bitmap_from_row_ids(order[bounds[code]:bounds[code + 1]])
+                    for code in range(len(categories))
+                ]
+
+        for column in numeric_columns:
+            values = snapshot.columns[column]
+            order = np.argsort(values, kind="stable").astype(np.int32)
+            index.sort_order[column] = order
+            index.sorted_values[column] = values[order]
+
+        index.build_seconds = time.perf_counter() - started
+        logger.info(
+            "Built transaction index over %d rows in %.1f ms", index.num_rows, index.build_seconds * 1000
+        )
+        return index
+
+    def _bitmap_from_row_ids(self, row_ids):
+        selected = np.zeros(self.num_rows, dtype=bool)
+        selected[row_ids] = True
+        return np.packbits(selected)
+
+    def _category_row_ids(self, column, codes):
+        order = self.category_order[column]
+        bounds = self.category_bounds[column]
+        slices = [order[bounds[code]:bounds[code + 1]] for code in codes]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int32)
+
+    def _range_offsets(self, column, low, high):
+        sorted_values = self.sorted_values[column]
+        # Search with keys of the column's own dtype, otherwise numpy converts the whole column first
+        if np.issubdtype(sorted_values.dtype, np.integer):
+            low = math.ceil(low) if low is not None else None
+            high = math.floor(high) if high is not None else None
+        start = np.searchsorted(sorted_values, sorted_values.dtype.type(low), side="left") if low is not None else 0
+        stop = (
+            np.searchsorted(sorted_values, sorted_values.dtype.type(high), side="right")
+            if high is not None
+            else len(sorted_values)
+        )
+        return start, max(start, stop)
+
+    def _plan(self, conditions):
+        # Turn parsed conditions into index lookups, each with the number of rows it matches
+        lookups = []
+        ranges = {}
+        for column, operator, value in conditions:
+            if operator == "in" and column in self.category_order:
+                codes = self.snapshot.category_codes[column]
+                wanted = sorted({codes[item] for item in value if item in codes})
+                bounds = self.category_bounds[column]
+                size = int(sum(bounds[code + 1] - bounds[code] for code in wanted))
+                lookups.append((size, "in", column, wanted))
+            elif operator in (">=", "<=") and column in self.sorted_values:
+                # Merge the lower and upper bound of a column into a single searchsorted range
+                low, high = ranges.get(column, (None, None))
+                if operator == ">=":
+                    low = value if low is None else max(low, value)
+                else:
+                    high = value if high is None else min(high, value)
+                ranges[column] = (low, high)
+            else:
+                lookups.append((self.num_rows, "scan", column, (operator, value)))
+
+        for column, (low, high) in ranges.items():
+            start, stop = self._range_offsets(column, low, high)
+            lookups.append((stop - start, "range", column, (low, high, start, stop)))
+
+        return sorted(lookups, key=lambda lookup: lookup[0])
+
+    def _lookup_row_ids(self, lookup):
+        _, kind, column, argument = lookup
+        if kind == "in":
+            return self._category_row_ids(column, argument)
+        if kind == "scan":
+            # Only planned first when it matches as few rows as any index lookup, e.g. in an empty snapshot
+            operator, value = argument
+            return np.flatnonzero(self.snapshot.condition_mask(column, operator, value))
+        _, _, start, stop = argument
+        return self.sort_order[column][start:stop]
+
+    def _filter_row_ids(self, row_ids, lookup):
+        _, kind, column, argument = lookup
+        values = self.snapshot.columns[column][row_ids]
+        if kind == "in":
+            selected = np.zeros(len(self.snapshot.categories[column]), dtype=bool)
+            selected[argument] = True
+            return row_ids[selected[values]]
+        if kind == "range":
+            low, high, _, _ = argument
+            keep = np.ones(len(row_ids), dtype=bool)
+            if low is not None:
+                keep &= values >= low
+            if high is not None:
+                keep &= values <= high
+            return row_ids[keep]
+        operator, value = argument
+        return row_ids[self.snapshot.condition_mask(column, operator, value, row_ids)]
+
+    def _lookup_bitmap(self, lookup):
+        _, kind, column, argument = lookup
+        if kind == "in" and column in self.bitmaps:
+            if not argument:
+                return np.zeros((self.num_rows + 7) // 8, dtype=np.uint8)
+            return np.bitwise_or.reduce([self.bitmaps[column][code] for code in argument])
+        if kind == "scan":
+            operator, value = argument
+            return np.packbits(self.snapshot.condition_mask(column, operator, value))
+        return self._bitmap_from_row_ids(self._lookup_row_ids(lookup))
+
+    # Resolve parsed (column, operator, value) conditions to the sorted ids of the matching rows
+    def row_ids(self, conditions):
+        lookups = self._plan(conditions)
+        if not lookups:
+            return np.arange(self.num_rows)
+
+        if lookups[0][0] * SELECTIVE_FRACTION <= self.num_rows:
+            # Selective query: start from the smallest candidate set and narrow it down
+            row_ids = np.sort(self._lookup_row_ids(lookups[0]))
+            for lookup in lookups[1:]:
+                if len(row_ids) == 0:
+                    break
+                row_ids = self._filter_row_ids(row_ids, lookup)
+            return row_ids
+
+        # Broad query: AND the packed bitmaps of every condition
+        bitmaps = [self._lookup_bitmap(lookup) for lookup in lookups]
+        combined = np.bitwise_and.reduce(bitmaps) if len(bitmaps) > 1 else bitmaps[0]
+        return np.flatnonzero(np.unpackbits(combined, count=self.num_rows))
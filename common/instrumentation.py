@@ -0,0 +1,189 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a cache hit to a slow backend call
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    # Cumulative-bucket duration histogram, as Prometheus exposes them
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+            self._last = seconds
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, last = self._sum, self._last
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return {"cumulative_counts": cumulative, "count": running, "sum": total, "last": last}
+
+    def quantile(self, q: float, snapshot=None):
+        # Linear interpolation inside the bucket holding the q-th observation, like histogram_quantile()
+        snapshot = snapshot or self.snapshot()
+        count = snapshot["count"]
+        if count == 0:
+            return 0.0
+        rank = q * count
+        cumulative = snapshot["cumulative_counts"]
+        index = bisect.bisect_left(cumulative, rank)
+        if index >= len(self.buckets):
+            return self.buckets[-1]
+        lower = self.buckets[index - 1] if index > 0 else 0.0
+        below = cumulative[index - 1] if index > 0 else 0
+        in_bucket = cumulative[index] - below
+        return lower + (self.buckets[index] - lower) * ((rank - below) / in_bucket if in_bucket else 0.0)
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def stage_histogram(tab: str, stage: str):
+    key = (tab, stage)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(key, Histogram())
+    return histogram
+
+
+# Time a block of a tab, e.g. `with span("estimate", "call_api"):`
+@contextmanager
+def span(tab: str, stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_histogram(tab, stage).observe(time.perf_counter() - started)
+
+
+def stage_summaries():
+    with _histograms_lock:
+        histograms = sorted(_histograms.items())
+    summaries = []
+    for (tab, stage), histogram in histograms:
+        snapshot = histogram.snapshot()
+        count = snapshot["count"]
+        summaries.append({
+            "tab": tab,
+            "stage": stage,
+            "count": count,
+            "mean_ms": snapshot["sum"] / count * 1000 if count else 0.0,
+            "p50_ms": histogram.quantile(0.5, snapshot) * 1000,
+            "p95_ms": histogram.quantile(0.95, snapshot) * 1000,
+            "last_ms": snapshot["last"] * 1000,
+        })
+    return summaries
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text(metrics=None):
+    # Stage histograms, plus optional metrics given as {name: (type, help, value)}, in the Prometheus text format
+    lines = [
+        "# HELP app_stage_duration_seconds Duration of instrumented stages of the app tabs",
+        "# TYPE app_stage_duration_seconds histogram",
+    ]
+    with _histograms_lock:
+        histograms = sorted(_histograms.items())
+    for (tab, stage), histogram in histograms:
+        snapshot = histogram.snapshot()
+        labels = f'tab="{tab}",stage="{stage}"'
+        for bound, count in zip(histogram.buckets + ("+Inf",), snapshot["cumulative_counts"]):
+            lines.append(f'app_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f"app_stage_duration_seconds_sum{{{labels}}} {_format_value(snapshot['sum'])}")
+        lines.append(f"app_stage_duration_seconds_count{{{labels}}} {snapshot['count']}")
+
+    for name, (metric_type, help_text, value) in sorted((metrics or {}).items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+_export_lock = threading.Lock()
+_export_started = False
+
+
+def _write_metrics_file(path: str, render):
+    # Write to a temporary file first, so scrapers never read a half-written file
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as metrics_file:
+        metrics_file.write(render())
+    os.replace(temporary_path, path)
+
+
+def _serve_metrics(port: int, render):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    logger.info("Serving metrics on http://127.0.0.1:%d/metrics", port)
+
+
+# Export the metrics returned by render() to a file every interval and/or on a local /metrics endpoint.
+# Streamlit reruns the app script on every interaction, so only the first call starts anything
+def start_metrics_export(render, path=None, port: int = 0, interval_seconds: float = 15):
+    global _export_started
+    with _export_lock:
+        if _export_started or not (path or port):
+            return
+        _export_started = True
+
+    if port:
+        _serve_metrics(port, render)
+
+    if path:
+        def write_periodically():
+            while True:
+                try:
+                    _write_metrics_file(path, render)
+                except OSError as error:
+                    logger.warning("Could not write metrics to %s: %s", path, error)
+                time.sleep(interval_seconds)
+
+        threading.Thread(target=write_periodically, name="metrics-file", daemon=True).start()
@@ -0,0 +1,102 @@
+import numpy as np
+
+from common.config import kde_exact_max_samples
+
+# create_distplot evaluates its curve on 500 points between the smallest and largest value
+KDE_GRID_POINTS = 500
+# The Gaussian kernel is cut off this many bandwidths from its center
+KERNEL_CUTOFF_BANDWIDTHS = 4
+
+
+def effective_sample_size(weights):
+    return weights.sum() ** 2 / np.dot(weights, weights)
+
+
+def select_bandwidth(values: np.ndarray, weights=None, method: str = "scott"):
+    # Same rules of thumb as scipy.stats.gaussian_kde, including its weighted variance
+    if weights is None:
+        weights = np.ones(len(values))
+    weights = np.asarray(weights, dtype=np.float64)
+    normalized = weights / weights.sum()
+    n_effective = effective_sample_size(weights)
+
+    mean = np.dot(normalized, values)
+    variance = np.dot(normalized, (values - mean) ** 2) / (1 - np.dot(normalized, normalized))
+    if method == "scott":
+        factor = n_effective ** (-1 / 5)
+    elif method == "silverman":
+        factor = (n_effective * 3 / 4) ** (-1 / 5)
+    else:
+        raise ValueError(f"Unknown bandwidth method: {method}")
+    return float(np.sqrt(variance) * factor)
+
+
+def linear_binning(values: np.ndarray, weights: np.ndarray, start: float, step: float, num_points: int):
+    # Split each value's weight between its two neighbouring grid points, proportional to closeness
+    positions = (values - start) / step
+    lower = np.clip(np.floor(positions).astype(np.intp), 0, num_points - 2)
+    fraction = positions - lower
+    counts = np.bincount(lower, weights=weights * (1 - fraction), minlength=num_points)
+    counts += np.bincount(lower + 1, weights=weights * fraction, minlength=num_points)
+    return counts
+
+
+def convolve_gaussian(counts: np.ndarray, step: float, bandwidth: float):
+    # Convolve the binned counts with a Gaussian kernel sampled on the same grid, through zero-padded FFTs
+    num_points = len(counts)
+    half_width = int(min(num_points - 1, np.ceil(KERNEL_CUTOFF_BANDWIDTHS * bandwidth / step)))
+    offsets = np.arange(-half_width, half_width + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+
+    fft_size = 1 << int(np.ceil(np.log2(num_points + len(kernel) - 1)))
+    convolved = np.fft.irfft(np.fft.rfft(counts, fft_size) * np.fft.rfft(kernel, fft_size), fft_size)
+    return convolved[half_width:half_width + num_points]
+
+
+def binned_kde_from_counts(counts, start: float, step: float, bandwidth: float):
+    # Density on the grid start, start + step, ... from counts already binned onto it
+    counts = np.asarray(counts, dtype=np.float64)
+    density = convolve_gaussian(counts, step, bandwidth) / counts.sum()
+    grid = start + step * np.arange(len(counts))
+    return grid, np.maximum(density, 0)
+
+
+def binned_kde(values, weights=None, bandwidth=None, num_points: int = KDE_GRID_POINTS, method: str = "scott"):
+    # Kernel density estimate in O(n + grid log grid) instead of the O(n * grid) of an exact evaluation
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if bandwidth is None:
+        bandwidth = select_bandwidth(values, weights, method)
+
+    start = values.min()
+    stop = values.max()
+    if bandwidth <= 0 or stop == start:
+        # Every value is the same: fall back to a narrow bump around it
+        bandwidth = bandwidth if bandwidth > 0 else max(abs(start) * 0.01, 1.0)
+        start -= KERNEL_CUTOFF_BANDWIDTHS * bandwidth
+        stop += KERNEL_CUTOFF_BANDWIDTHS * bandwidth
+
+    step = (stop - start) / (num_points - 1)
+    counts = linear_binning(values, weights, start, step, num_points)
+    return binned_kde_from_counts(counts, start, step, bandwidth)
+
+
+def kde_figure(values, weights=None, exact_max_samples: int = kde_exact_max_samples, bandwidth=None):
+    # Plotly figure with a single KDE line trace, like create_distplot without histogram and rug
+    values = np.asarray(values, dtype=np.float64)
+    if weights is None and bandwidth is None and len(values) <= exact_max_samples:
+        import plotly.figure_factory as ff
+
+        return ff.create_distplot([values], group_labels=['Average Price per Square Meter'], show_hist=False, show_rug=False)
+
+    import plotly.graph_objs as go
+
+    grid, density = binned_kde(values, weights, bandwidth)
+    fig = go.Figure(go.Scatter(
+        x=grid,
+        y=density,
+        mode='lines',
+        name='Average Price per Square Meter',
+        showlegend=False,
+    ))
+    return fig
@@ -0,0 +1,298 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from common.filters import Filter, FilterError
+from common.indexes import TransactionIndex
+from common.sketches import SketchCube, quantile_rank_errors
+from common.statistics import SUMMARY_BIN_WIDTH, price_histogram, price_midpoints, summarize_prices
+
+logger = logging.getLogger(__name__)
+
+# Low-cardinality text columns, stored dictionary-encoded as integer codes plus their categories
+CATEGORICAL_COLUMNS = ("postal_code", "city", "plot_ownership", "room_category", "building_type", "state")
+NUMERIC_COLUMNS = ("year_built", "square_meters")
+REQUIRED_COLUMNS = CATEGORICAL_COLUMNS + NUMERIC_COLUMNS + (
+    "min_price_per_square_meter",
+    "max_price_per_square_meter",
+    "transactions",
+)
+# Optional columns: the debt-free price of the sales in a row, and the year they were sold in
+OPTIONAL_COLUMNS = ("price", "sale_year")
+
+# Valuations only consider transactions sold in the last 2 years of the snapshot, like the backend does
+VALUATION_WINDOW_YEARS = 2
+
+
+def snapshot_version(path: str):
+    # Changes whenever the snapshot file is replaced
+    return f"{os.path.basename(path)}:{int(os.path.getmtime(path))}"
+
+
+class TransactionSnapshot:
+    def __init__(self, columns: dict, categories: dict, version: str = ""):
+        missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise ValueError(f"Snapshot is missing columns: {', '.join(missing)}")
+
+        self.columns = columns
+        self.categories = categories
+        self.version = version
+        self.num_rows = len(columns["transactions"])
+        # Map each category value to its code, for turning IN-lists into code lookups
+        self.category_codes = {
+            column: {value: code for code, value in enumerate(values)}
+            for column, values in categories.items()
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, version: str = ""):
+        columns = {}
+        categories = {}
+        for name, values in arrays.items():
+            if name.endswith("__categories"):
+                continue
+            values = np.asarray(values)
+            if f"{name}__categories" in arrays:
+                # Already dictionary-encoded as "<column>" codes plus "<column>__categories"
+                columns[name] = values.astype(np.int32, copy=False)
+                categories[name] = np.asarray(arrays[f"{name}__categories"]).astype(str)
+            elif name in CATEGORICAL_COLUMNS:
+                category_values, codes = np.unique(values.astype(str), return_inverse=True)
+                columns[name] = codes.astype(np.int32)
+                categories[name] = category_values
+            else:
+                columns[name] = values
+        return cls(columns, categories, version)
+
+    @classmethod
+    def load(cls, path: str):
+        version = snapshot_version(path)
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension == ".npz":
+            with np.load(path, allow_pickle=False) as data:
+                return cls.from_arrays({name: data[name] for name in data.files}, version)
+
+        if extension in (".parquet", ".arrow", ".feather"):
+            try:
+                import pyarrow.feather as feather
+                import pyarrow.parquet as parquet
+            except ImportError:
+                raise ImportError("Reading Parquet/Arrow snapshots requires pyarrow: pip install pyarrow")
+
+            table = parquet.read_table(path) if extension == ".parquet" else feather.read_table(path)
+            arrays = {}
+            for name in table.column_names:
+                arrays[name] = table.column(name).to_numpy()
+            return cls.from_arrays(arrays, version)
+
+        raise ValueError(f"Unsupported snapshot format: {path}")
+
+    def save_npz(self, path: str):
+        arrays = dict(self.columns)
+        for name, values in self.categories.items():
+            arrays[f"{name}__categories"] = np.asarray(values, dtype=str)
+        np.savez(path, **arrays)
+
+    # Evaluate one condition over all rows, or only over the given row ids
+    def condition_mask(self, column: str, operator: str, value, row_ids=None):
+        if column not in self.columns:
+            raise FilterError(f"Unknown column: {column}")
+
+        values = self.columns[column] if row_ids is None else self.columns[column][row_ids]
+        if operator == "in":
+            if column in self.categories:
+                # Look codes up in a boolean table instead of comparing strings row by row
+                selected = np.zeros(len(self.categories[column]), dtype=bool)
+                codes = self.category_codes[column]
+                selected[[codes[item] for item in value if item in codes]] = True
+                return selected[values]
+            return np.isin(values, np.asarray(value, dtype=values.dtype))
+        if operator == ">=":
+            return values >= value
+        return values <= value
+
+    # Full scan, used when no index has been built
+    def mask(self, query_filter: Filter):
+        return query_filter.to_mask(self)
+
+
+class LocalEngine:
+    def __init__(self, snapshot: TransactionSnapshot, build_index: bool = True, build_sketch_cube: bool = False):
+        self.snapshot = snapshot
+        self.index = TransactionIndex.build(snapshot, NUMERIC_COLUMNS) if build_index else None
+        self.sketch_cube = SketchCube.build(snapshot) if build_sketch_cube else None
+        # The valuation window ends at the newest sale in the snapshot rather than at the current year, so an
+        # older snapshot or synthetic data keeps answering with the same transactions as time goes on
+        sale_years = snapshot.columns.get("sale_year")
+        self.latest_sale_year = int(sale_years.max()) if sale_years is not None and len(sale_years) else None
+        # Set by get_local_engine for the process-wide engine
+        self.load_seconds = 0.0
+
+    # Ids of the rows matching the where clause, resolved through the index when there is one
+    def row_ids(self, where_clause):
+        return self.filter_row_ids(Filter.from_where_clause(where_clause))
+
+    def filter_row_ids(self, query_filter: Filter):
+        if self.index is None:
+            return np.flatnonzero(self.snapshot.mask(query_filter))
+
+        conditions = query_filter.conditions()
+        for column, _, _ in conditions:
+            if column not in self.snapshot.columns:
+                raise FilterError(f"Unknown column: {column}")
+        return self.index.row_ids(conditions)
+
+    def get_price_per_square_meters(self, where_clause):
+        columns = self.snapshot.columns
+        rows = self.row_ids(where_clause)
+        # NumPy arrays, like the binary format of the HTTP client decodes to
+        return {
+            "min_prices_per_square_meter": columns["min_price_per_square_meter"][rows],
+            "max_prices_per_square_meter": columns["max_price_per_square_meter"][rows],
+            "transactions": columns["transactions"][rows],
+        }
+
+    def price_histogram(self, where_clause, bin_width: float = SUMMARY_BIN_WIDTH):
+        # Mode "summary": a histogram of the price per square meter instead of every price group,
+        # merged from the sketch cube when there is one and it covers the filter
+        if self.sketch_cube is not None:
+            histogram = self.sketch_cube.histogram(Filter.from_where_clause(where_clause), self.filter_row_ids, bin_width)
+            if histogram is not None:
+                return histogram
+
+        columns = self.snapshot.columns
+        rows = self.row_ids(where_clause)
+        midpoints = price_midpoints(columns["min_price_per_square_meter"][rows], columns["max_price_per_square_meter"][rows])
+        return price_histogram(midpoints, columns["transactions"][rows], bin_width)
+
+    def property_price_valuation(self, where_clause):
+        columns = self.snapshot.columns
+        rows = self.row_ids(where_clause)
+        if self.latest_sale_year is not None:
+            rows = rows[columns["sale_year"][rows] >= self.latest_sale_year - VALUATION_WINDOW_YEARS]
+
+        weights = columns["transactions"][rows].astype(np.float64)
+        if "price" in columns:
+            prices = columns["price"][rows].astype(np.float64)
+        else:
+            # Without a price column, estimate it from the square meter price and the size
+            prices_per_square_meter = (
+                columns["min_price_per_square_meter"][rows] + columns["max_price_per_square_meter"][rows]
+            ) / 2
+            prices = prices_per_square_meter * columns["square_meters"][rows]
+
+        sample_size = int(weights.sum())
+        if sample_size == 0:
+            return {"mean": 0.0, "standard_deviation": 0.0, "sample_size": 0}
+
+        mean = float(np.dot(weights, prices) / sample_size)
+        variance = float(np.dot(weights, (prices - mean) ** 2) / sample_size)
+        return {"mean": mean, "standard_deviation": variance ** 0.5, "sample_size": sample_size}
+
+    # Count, moments, extremes and quartiles of the price per square meter, answered from the
+    # sketch cube when it covers the filter and computed exactly from the matching rows otherwise
+    def price_summary(self, where_clause):
+        query_filter = Filter.from_where_clause(where_clause)
+        if self.sketch_cube is not None:
+            summary = self.sketch_cube.summary(query_filter, self.filter_row_ids)
+            if summary is not None:
+                summary["source"] = "sketch"
+                return summary
+
+        columns = self.snapshot.columns
+        rows = self.filter_row_ids(query_filter)
+        transactions = columns["transactions"][rows]
+        if transactions.sum() == 0:
+            return {"count": 0, "source": "exact"}
+
+        summary = summarize_prices(
+            columns["min_price_per_square_meter"][rows], columns["max_price_per_square_meter"][rows], transactions
+        )
+        weights = summary.weights if summary.weights is not None else np.ones(len(summary.midpoints))
+        variance = np.dot(weights, (summary.midpoints - summary.mean) ** 2) / weights.sum()
+        return {
+            "count": summary.count,
+            "mean": summary.mean,
+            "standard_deviation": float(np.sqrt(variance)),
+            "min": summary.min,
+            "max": summary.max,
+            "quantiles": {0.25: summary.q25, 0.5: summary.median, 0.75: summary.q75},
+            "source": "exact",
+        }
+
+    # Rank error of each sketch quartile against the exact rows, to check the sketch's accuracy on real filters
+    def sketch_error(self, where_clause):
+        if self.sketch_cube is None:
+            return None
+        query_filter = Filter.from_where_clause(where_clause)
+        summary = self.sketch_cube.summary(query_filter, self.filter_row_ids)
+        if summary is None or summary["count"] == 0:
+            return None
+
+        columns = self.snapshot.columns
+        rows = self.filter_row_ids(query_filter)
+        prices = price_midpoints(columns["min_price_per_square_meter"][rows], columns["max_price_per_square_meter"][rows])
+        return quantile_rank_errors(summary["quantiles"], prices, columns["transactions"][rows])
+
+    # Answer a backend request in-process, returning the same (response_data, error) pair as the HTTP client
+    def handle(self, endpoint_path: str, payload: dict):
+        handlers = {
+            "/get-price-per-square-meters/": self.get_price_per_square_meters,
+            "/property-price-valuation/": self.property_price_valuation,
+        }
+        handler = handlers.get(endpoint_path)
+        if handler is None:
+            return None, f"Unsupported endpoint for the local engine: {endpoint_path}"
+
+        if endpoint_path == "/get-price-per-square-meters/" and payload.get("mode") == "summary":
+            try:
+                bin_width = float(payload.get("bin_width", SUMMARY_BIN_WIDTH))
+            except (TypeError, ValueError):
+                bin_width = 0.0
+            if not bin_width > 0:
+                return None, f"Invalid bin width: {payload.get('bin_width')}"
+            handler = lambda where_clause: self.price_histogram(where_clause, bin_width)
+
+        try:
+            return handler(payload.get("where_clause", [])), None
+        except FilterError as e:
+            return None, str(e)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_local_engine(snapshot_path: str, build_sketch_cube: bool = False):
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                started = time.perf_counter()
+                snapshot = TransactionSnapshot.load(snapshot_path)
+                load_seconds = time.perf_counter() - started
+                logger.info(
+                    "Loaded %d transaction rows from %s in %.1f ms", snapshot.num_rows, snapshot_path, load_seconds * 1000
+                )
+                engine = LocalEngine(snapshot, build_sketch_cube=build_sketch_cube)
+                engine.load_seconds = load_seconds
+                _engine = engine
+    return _engine
+
+
+def local_engine_stats():
+    # None until the first local query loads the snapshot, so reading the stats never loads it
+    engine = _engine
+    if engine is None:
+        return None
+    return {
+        "rows": engine.snapshot.num_rows,
+        "load_seconds": engine.load_seconds,
+        "index_build_seconds": engine.index.build_seconds if engine.index is not None else 0.0,
+        "sketch_cube_build_seconds": engine.sketch_cube.build_seconds if engine.sketch_cube is not None else None,
+    }
@@ -0,0 +1,87 @@
+import cProfile
+import glob
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import streamlit as st
+
+from common.config import profile_dir, profile_max_files, profile_query_param, profile_reruns, profile_top_n
+
+
+def profiling_enabled():
+    if profile_reruns:
+        return True
+    return profile_query_param and st.query_params.get("profile", "").lower() in ("1", "true", "yes")
+
+
+def top_functions(profile: pstats.Stats, top_n: int):
+    rows = []
+    for (file_name, line, function), (_, calls, own_time, cumulative_time, _) in profile.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(file_name)}:{line}({function})" if line else function,
+            "calls": calls,
+            "cumulative_ms": cumulative_time * 1000,
+            "own_ms": own_time * 1000,
+            "per_call_ms": cumulative_time / calls * 1000 if calls else 0.0,
+        })
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:top_n]
+
+
+def dump_profile(profiler: cProfile.Profile, name: str):
+    os.makedirs(profile_dir, exist_ok=True)
+    path = os.path.join(profile_dir, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.prof")
+    profiler.dump_stats(path)
+    remove_old_profiles()
+    return path
+
+
+def _modified_at(path: str):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def remove_old_profiles():
+    if not profile_max_files:
+        return
+    paths = sorted(glob.glob(os.path.join(profile_dir, "*.prof")), key=_modified_at)
+    for path in paths[:-profile_max_files]:
+        try:
+            os.remove(path)
+        except OSError:
+            # Another session removed it first
+            pass
+
+
+# Profile one script run of a page with cProfile, save it for snakeviz/pstats and show the top functions.
+# Usable as `with profile_rerun("estimate"):` or as a decorator; when profiling is off it only checks the flag
+@contextmanager
+def profile_rerun(name: str):
+    if not profiling_enabled():
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as error:
+        # Only one profiler can be active per thread, e.g. not under a debugger's or coverage's
+        st.warning(f"Could not profile {name}: {error}")
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        path = dump_profile(profiler, name)
+        with st.expander(f"Profile of {name}: {elapsed * 1000:.0f} ms", expanded=True):
+            st.caption(f"Saved to {path}")
+            st.dataframe(top_functions(pstats.Stats(profiler), profile_top_n), use_container_width=True)
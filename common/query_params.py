@@ -0,0 +1,140 @@
+import csv
+import json
+import sys
+from datetime import datetime
+
+from common.filters import build_filter, process_postal_codes
+
+# Query parameters of the estimation page, also used for batch input rows
+QUERY_PARAM_NAMES = (
+    "postal_code",
+    "start_year",
+    "end_year",
+    "min_m2",
+    "max_m2",
+    "cities",
+    "ownership_types",
+    "room_numbers",
+    "prop_type",
+    "condition",
+)
+
+# Cities offered by the estimation page
+CITY_OPTIONS = (
+    "espoo",
+    "vantaa",
+    "helsinki",
+    "tampere",
+    "jarvenpaa",
+    "kerava",
+    "jyvaskyla",
+    "oulu",
+    "kuopio",
+    "joensuu",
+    "turku",
+    "kouvola",
+    "lahti",
+    "porvoo",
+    "tuusula",
+    "kauniainen",
+)
+
+ROOM_NUMBER_OPTIONS = {
+    "1": ["Yksiö", "Yksiöt"],
+    "2": ["Kaksiot", "Kaksi huonetta"],
+    "3": ["Kolmiot", "Kolme huonetta"],
+    "4": ["Neljä huonetta tai enemmän"],
+}
+
+CONDITION_OPTIONS = {
+    "good": "hyvä",
+    "ok": "tyyd.",
+    "bad": "huono",
+}
+
+
+def read_filters(path: str):
+    # Yield a (row, error) pair per row of a CSV or JSONL file, one at a time so the input is never held
+    # in memory. A line that is not valid JSON gets an error instead of ending the input
+    input_file = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if path.endswith(".jsonl") or path == "-":
+            for line in input_file:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line), None
+                except ValueError as e:
+                    yield None, f"Invalid JSON: {e}"
+        else:
+            for row in csv.DictReader(input_file):
+                yield row, None
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+
+
+def normalize_query_params(row: dict):
+    # Same vocabulary as the estimation page: lists become comma separated strings, blanks are left out
+    query_params = {}
+    for name in QUERY_PARAM_NAMES:
+        value = row.get(name)
+        if value is None or value == "" or value == []:
+            continue
+        query_params[name] = ",".join(str(item) for item in value) if isinstance(value, list) else str(value)
+    return query_params
+
+
+def string_to_list(input_string):
+    # Check if the string is empty after removing brackets
+    if not input_string:
+        return []
+
+    # Split the string by commas and strip whitespace from each element
+    result_list = [item.strip() for item in input_string.split(',')]
+
+    return result_list
+
+
+def query_params_to_filter(query_params, widen_narrow_ranges: bool = False):
+    # Returns the filter and the postal code validation error, if any
+    postal_codes_input_text = query_params.get('postal_code', [])
+
+    current_year = datetime.now().year
+    end_year = current_year + 2
+    selected_start_year = query_params.get('start_year', 1880)
+    selected_end_year = query_params.get('end_year', end_year)
+    selected_min_square_meter = query_params.get('min_m2', 25)
+    selected_max_square_meter = query_params.get('max_m2', 85)
+
+    # Very narrow ranges yield too few transactions, so widen them a little
+    if widen_narrow_ranges:
+        if (int(selected_end_year) - int(selected_start_year)) < 5:
+            selected_start_year = str(int(selected_start_year) - 2)
+            selected_end_year = str(int(selected_end_year) + 2)
+
+        if (int(selected_max_square_meter) - int(selected_min_square_meter)) < 4:
+            selected_min_square_meter = str(int(selected_min_square_meter) - 2)
+            selected_max_square_meter = str(int(selected_max_square_meter) + 2)
+
+    selected_room_number_options = []
+    for room_number in string_to_list(query_params.get('room_numbers', None)):
+        selected_room_number_options.extend(ROOM_NUMBER_OPTIONS.get(room_number, []))
+
+    selected_property_condition_options = [
+        CONDITION_OPTIONS[condition]
+        for condition in string_to_list(query_params.get('condition', None))
+        if condition in CONDITION_OPTIONS
+    ]
+
+    return build_filter(
+        postal_codes_input_text,
+        [selected_start_year, selected_end_year],
+        [selected_min_square_meter, selected_max_square_meter],
+        string_to_list(query_params.get('cities', None)),
+        string_to_list(query_params.get('ownership_types', None)),
+        selected_room_number_options,
+        string_to_list(query_params.get('prop_type', None)),
+        selected_property_condition_options,
+        process_postal_codes,
+    )
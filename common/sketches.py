@@ -0,0 +1,372 @@
+import logging
+import math
+import time
+
+import numpy as np
+
+from common.statistics import (
+    SUMMARY_BIN_WIDTH,
+    SUMMARY_QUANTILES,
+    histogram_bins,
+    price_histogram,
+    price_midpoints,
+    weighted_quantiles,
+)
+
+logger = logging.getLogger(__name__)
+
+# Trade-off between size and accuracy: a merged sketch keeps at most about this many centroids
+DEFAULT_COMPRESSION = 200
+# Dimensions of a pre-aggregated cell. City is functionally dependent on the postal code,
+# so it does not add cells, but it lets city filters be answered from the cube too.
+CELL_DIMENSIONS = ("postal_code", "city", "building_type", "room_category")
+# Range columns aggregated into fixed-size buckets
+BUCKET_DIMENSIONS = ("year_built", "square_meters")
+YEAR_BUCKET_SIZE = 5
+SQUARE_METER_BUCKET_SIZE = 5
+# Selections with at most this many uncompressed rows get exact quantiles instead of sketch estimates
+SKETCH_MIN_CENTROIDS = 10000
+
+
+def _compress(means: np.ndarray, weights: np.ndarray, compression: int):
+    # Merge neighbouring centroids whose quantiles fall in the same unit of the t-digest k1 scale function,
+    # which keeps the tails (and so min, max and extreme quantiles) finely resolved
+    if len(means) <= compression:
+        order = np.argsort(means, kind="stable")
+        return means[order], weights[order]
+
+    order = np.argsort(means, kind="stable")
+    means = means[order]
+    weights = weights[order]
+    cumulative = np.cumsum(weights)
+    midpoint_quantiles = (cumulative - weights / 2) / cumulative[-1]
+    scale = compression / (2 * math.pi) * np.arcsin(2 * midpoint_quantiles - 1)
+    groups = np.floor(scale - scale[0]).astype(np.intp)
+    merged_weights = np.bincount(groups, weights=weights)
+    merged_sums = np.bincount(groups, weights=weights * means)
+    present = merged_weights > 0
+    return merged_sums[present] / merged_weights[present], merged_weights[present]
+
+
+class QuantileSketch:
+    # Mergeable t-digest style quantile sketch: weighted centroids plus the exact extremes
+    def __init__(self, means, weights, minimum: float, maximum: float, compression: int = DEFAULT_COMPRESSION):
+        self.means = means
+        self.weights = weights
+        self.min = minimum
+        self.max = maximum
+        self.compression = compression
+
+    @classmethod
+    def from_values(cls, values, weights=None, compression: int = DEFAULT_COMPRESSION):
+        values = np.asarray(values, dtype=np.float64)
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64)
+        means, weights = _compress(values, weights, compression)
+        return cls(means, weights, float(values.min()), float(values.max()), compression)
+
+    @classmethod
+    def merge_all(cls, sketches, compression: int = DEFAULT_COMPRESSION):
+        sketches = list(sketches)
+        means = np.concatenate([sketch.means for sketch in sketches])
+        weights = np.concatenate([sketch.weights for sketch in sketches])
+        means, weights = _compress(means, weights, compression)
+        return cls(
+            means,
+            weights,
+            min(sketch.min for sketch in sketches),
+            max(sketch.max for sketch in sketches),
+            compression,
+        )
+
+    def merge(self, other: "QuantileSketch"):
+        return QuantileSketch.merge_all([self, other], self.compression)
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def quantiles(self, quantiles):
+        # Interpolate between centroid centers, each placed at the middle of its weight
+        cumulative = np.cumsum(self.weights)
+        centers = cumulative - self.weights / 2
+        positions = np.concatenate(([0.0], centers, [cumulative[-1]]))
+        values = np.concatenate(([self.min], self.means, [self.max]))
+        return np.interp(np.asarray(quantiles, dtype=np.float64) * cumulative[-1], positions, values)
+
+    def quantile(self, q: float):
+        return float(self.quantiles([q])[0])
+
+
+class SketchCube:
+    # Per cell counts, sums, extremes and a quantile sketch of the price per square meter,
+    # with cells keyed by CELL_DIMENSIONS plus a year built bucket and a square meter bucket.
+    # Centroids of all cells are stored back to back; the centroids of cell c are at offsets[c]:offsets[c + 1].
+    # Range filters rarely fall on bucket edges, so only the cells entirely inside the filter are read from
+    # the cube, and the matching rows of the partially covered edge buckets are added exactly
+    def __init__(self, snapshot, year_bucket_size=YEAR_BUCKET_SIZE, square_meter_bucket_size=SQUARE_METER_BUCKET_SIZE,
+                 compression: int = DEFAULT_COMPRESSION):
+        self.snapshot = snapshot
+        self.bucket_sizes = {"year_built": year_bucket_size, "square_meters": square_meter_bucket_size}
+        self.compression = compression
+        self.build_seconds = 0.0
+
+    @classmethod
+    def build(cls, snapshot, **options):
+        started = time.perf_counter()
+        cube = cls(snapshot, **options)
+        columns = snapshot.columns
+
+        prices = price_midpoints(columns["min_price_per_square_meter"], columns["max_price_per_square_meter"])
+        counts = columns["transactions"].astype(np.float64)
+        keys = np.stack(
+            [columns[dimension].astype(np.int64) for dimension in CELL_DIMENSIONS]
+            + [cube.buckets(column, columns[column]) for column in BUCKET_DIMENSIONS],
+            axis=1,
+        )
+        present = counts > 0
+        keys, prices, counts = keys[present], prices[present], counts[present]
+
+        # Cells come out sorted by postal code first, so each postal code owns a contiguous run of cells
+        cell_keys, cell_ids = np.unique(keys, axis=0, return_inverse=True)
+        cell_ids = cell_ids.ravel()
+        num_cells = len(cell_keys)
+        cube.cell_keys = cell_keys
+        cube.cell_count = np.bincount(cell_ids, weights=counts, minlength=num_cells)
+        cube.cell_sum = np.bincount(cell_ids, weights=counts * prices, minlength=num_cells)
+        cube.cell_sum_squares = np.bincount(cell_ids, weights=counts * prices ** 2, minlength=num_cells)
+        # Sum of the squared row weights, for the effective sample size the KDE bandwidth rules use
+        cube.cell_sum_weight_squares = np.bincount(cell_ids, weights=counts ** 2, minlength=num_cells)
+        cube.cell_min = np.full(num_cells, np.inf)
+        cube.cell_max = np.full(num_cells, -np.inf)
+        np.minimum.at(cube.cell_min, cell_ids, prices)
+        np.maximum.at(cube.cell_max, cell_ids, prices)
+        cube.postal_code_offsets = np.searchsorted(
+            cell_keys[:, 0], np.arange(len(snapshot.categories["postal_code"]) + 1)
+        )
+
+        # Small cells keep their rows as exact centroids, only large cells are compressed
+        order = np.lexsort((prices, cell_ids))
+        sorted_prices = prices[order]
+        sorted_counts = counts[order]
+        row_offsets = np.searchsorted(cell_ids[order], np.arange(num_cells + 1))
+        centroid_sizes = np.diff(row_offsets)
+        means_parts = []
+        weights_parts = []
+        previous = 0
+        for cell in np.flatnonzero(centroid_sizes > cube.compression):
+            start, stop = row_offsets[cell], row_offsets[cell + 1]
+            means, weights = _compress(sorted_prices[start:stop], sorted_counts[start:stop], cube.compression)
+            means_parts += [sorted_prices[previous:start], means]
+            weights_parts += [sorted_counts[previous:start], weights]
+            centroid_sizes[cell] = len(means)
+            previous = stop
+        means_parts.append(sorted_prices[previous:])
+        weights_parts.append(sorted_counts[previous:])
+        cube.centroid_means = np.concatenate(means_parts)
+        cube.centroid_weights = np.concatenate(weights_parts)
+        cube.centroid_offsets = np.concatenate(([0], np.cumsum(centroid_sizes)))
+        cube.cell_compressed = np.diff(row_offsets) > cube.compression
+
+        cube.build_seconds = time.perf_counter() - started
+        logger.info(
+            "Built sketch cube with %d cells over %d rows in %.1f ms",
+            num_cells, snapshot.num_rows, cube.build_seconds * 1000,
+        )
+        return cube
+
+    def buckets(self, column: str, values):
+        return np.floor(values / self.bucket_sizes[column]).astype(np.int64)
+
+    def _inner_buckets(self, term):
+        # First and last bucket lying entirely inside the range, None for an open end. A bucket b holds
+        # b * size ... (b + 1) * size - 1 of a whole-number column and [b * size, (b + 1) * size) otherwise
+        size = self.bucket_sizes[term.column]
+        integer_valued = np.issubdtype(self.snapshot.columns[term.column].dtype, np.integer)
+        first = math.ceil(term.low / size) if term.low is not None else None
+        if term.high is None:
+            last = None
+        elif integer_valued:
+            last = math.floor((term.high + 1) / size) - 1
+        else:
+            last = math.floor(term.high / size) - 1
+        return first, last
+
+    def select_cells(self, query_filter):
+        # Ids of the cells entirely inside the filter, the bucket range of each filtered bucketed column,
+        # and the filters whose rows cover the rest of the filtered rows, or None when the filter uses a
+        # column the cube does not aggregate by
+        from common.filters import Filter, InSet, Range
+
+        dimension_positions = {dimension: position for position, dimension in enumerate(CELL_DIMENSIONS)}
+        cells = None
+        conditions = []
+        inner_buckets = {}
+        edge_filters = []
+        for term in query_filter.terms:
+            if isinstance(term, InSet) and term.column in dimension_positions:
+                codes = self.snapshot.category_codes[term.column]
+                wanted = np.array(sorted({codes[value] for value in term.expanded_values() if value in codes}), dtype=np.int64)
+                if term.column == "postal_code":
+                    offsets = self.postal_code_offsets
+                    cells = np.concatenate(
+                        [np.arange(offsets[code], offsets[code + 1]) for code in wanted] or [np.empty(0, dtype=np.intp)]
+                    )
+                else:
+                    conditions.append((dimension_positions[term.column], wanted))
+            elif isinstance(term, Range) and term.column in BUCKET_DIMENSIONS:
+                first, last = self._inner_buckets(term)
+                if first is not None and last is not None and first > last:
+                    # No bucket fits inside the range, every matching row is an edge row
+                    return np.empty(0, dtype=np.intp), {}, [query_filter]
+                size = self.bucket_sizes[term.column]
+                position = len(CELL_DIMENSIONS) + BUCKET_DIMENSIONS.index(term.column)
+                conditions.append((position, (first, last)))
+                inner_buckets[term.column] = (first, last)
+                # Edge filters include the bucket boundaries themselves; their inner rows are dropped later
+                if first is not None and term.low < first * size:
+                    edge_filters.append(Filter(query_filter.terms + (Range(term.column, None, first * size),)))
+                if last is not None and (last + 1) * size <= term.high:
+                    edge_filters.append(Filter(query_filter.terms + (Range(term.column, (last + 1) * size, None),)))
+            else:
+                return None, None, None
+
+        if cells is None:
+            cells = np.arange(len(self.cell_keys))
+        for position, condition in conditions:
+            keys = self.cell_keys[cells, position]
+            if isinstance(condition, tuple):
+                first, last = condition
+                keep = np.ones(len(cells), dtype=bool)
+                if first is not None:
+                    keep &= keys >= first
+                if last is not None:
+                    keep &= keys <= last
+            else:
+                keep = np.isin(keys, condition)
+            cells = cells[keep]
+        return cells, inner_buckets, edge_filters
+
+    def _edge_rows(self, inner_buckets, edge_filters, filter_row_ids):
+        # Filtered rows outside the selected cells, from the edge filters' rows minus those in an inner bucket
+        # of every bucketed column
+        if not edge_filters:
+            return np.empty(0, dtype=np.intp)
+        rows = np.unique(np.concatenate([filter_row_ids(edge_filter) for edge_filter in edge_filters]))
+        if not inner_buckets:
+            # No bucket fits inside the filter, the edge filter is the filter itself
+            return rows
+        inside = np.ones(len(rows), dtype=bool)
+        for column, (first, last) in inner_buckets.items():
+            buckets = self.buckets(column, self.snapshot.columns[column][rows])
+            if first is not None:
+                inside &= buckets >= first
+            if last is not None:
+                inside &= buckets <= last
+        return rows[~inside]
+
+    def _gather(self, query_filter, filter_row_ids):
+        # Totals, extremes and centroids of the filtered rows: the selected cells' plus the exact edge rows',
+        # or None when the cube cannot answer the filter
+        cells, inner_buckets, edge_filters = self.select_cells(query_filter)
+        if cells is None:
+            return None
+
+        columns = self.snapshot.columns
+        rows = self._edge_rows(inner_buckets, edge_filters, filter_row_ids)
+        edge_prices = price_midpoints(columns["min_price_per_square_meter"][rows], columns["max_price_per_square_meter"][rows])
+        edge_weights = columns["transactions"][rows].astype(np.float64)
+        present = edge_weights > 0
+        edge_prices, edge_weights = edge_prices[present], edge_weights[present]
+
+        # Gather the centroids of every selected cell with one fancy index instead of a loop
+        starts = self.centroid_offsets[cells]
+        lengths = self.centroid_offsets[cells + 1] - starts
+        first_positions = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        centroid_ids = np.repeat(starts - first_positions, lengths) + np.arange(lengths.sum())
+        return {
+            "count": float(self.cell_count[cells].sum() + edge_weights.sum()),
+            "sum": float(self.cell_sum[cells].sum() + np.dot(edge_weights, edge_prices)),
+            "sum_squares": float(self.cell_sum_squares[cells].sum() + np.dot(edge_weights, edge_prices ** 2)),
+            "sum_weight_squares": float(self.cell_sum_weight_squares[cells].sum() + np.dot(edge_weights, edge_weights)),
+            "min": float(min(self.cell_min[cells].min(initial=np.inf), edge_prices.min(initial=np.inf))),
+            "max": float(max(self.cell_max[cells].max(initial=-np.inf), edge_prices.max(initial=-np.inf))),
+            "means": np.concatenate((self.centroid_means[centroid_ids], edge_prices)),
+            "weights": np.concatenate((self.centroid_weights[centroid_ids], edge_weights)),
+            "compressed": bool(self.cell_compressed[cells].any()),
+            "edge_rows": len(rows),
+        }
+
+    def summary(self, query_filter, filter_row_ids, quantiles=SUMMARY_QUANTILES):
+        # Count, moments, extremes and quantiles of the price per square meter, or None when the cube cannot
+        # answer the filter. filter_row_ids(filter) returns the ids of the rows matching a filter
+        gathered = self._gather(query_filter, filter_row_ids)
+        if gathered is None:
+            return None
+
+        count = gathered["count"]
+        if count == 0:
+            return {"count": 0, "edge_rows": gathered["edge_rows"]}
+
+        mean = gathered["sum"] / count
+        variance = max(gathered["sum_squares"] / count - mean ** 2, 0.0)
+        means, weights = gathered["means"], gathered["weights"]
+        if len(means) <= SKETCH_MIN_CENTROIDS and not gathered["compressed"]:
+            # The centroids are still the raw rows, so the quantiles can be computed exactly
+            values, _, _ = weighted_quantiles(means, weights, quantiles)
+        else:
+            means, weights = _compress(means, weights, self.compression)
+            values = QuantileSketch(means, weights, gathered["min"], gathered["max"], self.compression).quantiles(quantiles)
+        return {
+            "count": int(round(count)),
+            "mean": float(mean),
+            "standard_deviation": float(np.sqrt(variance)),
+            "min": gathered["min"],
+            "max": gathered["max"],
+            "quantiles": dict(zip(quantiles, np.asarray(values).tolist())),
+            "edge_rows": gathered["edge_rows"],
+        }
+
+    def histogram(self, query_filter, filter_row_ids, bin_width: float = SUMMARY_BIN_WIDTH):
+        # The response of mode "summary", like statistics.price_histogram of the filtered rows: exact count,
+        # moments and extremes, with the bin counts of the centroids. Those are exact for uncompressed cells
+        gathered = self._gather(query_filter, filter_row_ids)
+        if gathered is None:
+            return None
+        if gathered["count"] == 0:
+            return price_histogram(np.empty(0), bin_width=bin_width)
+
+        count = gathered["count"]
+        mean = gathered["sum"] / count
+        squared_weights = gathered["sum_weight_squares"] / count ** 2
+        population_variance = max(gathered["sum_squares"] / count - mean ** 2, 0.0)
+        variance = population_variance / (1 - squared_weights) if squared_weights < 1 else 0.0
+        bin_start, bin_width, counts = histogram_bins(
+            gathered["means"], gathered["weights"], gathered["min"], gathered["max"], bin_width
+        )
+        return {
+            "bin_start": float(bin_start),
+            "bin_width": float(bin_width),
+            "counts": np.rint(counts).astype(np.int64),
+            "count": int(round(count)),
+            "mean": float(mean),
+            "variance": float(variance),
+            "effective_sample_size": float(1 / squared_weights),
+            "min": gathered["min"],
+            "max": gathered["max"],
+        }
+
+
+def quantile_rank_errors(sketch_quantiles: dict, values, weights):
+    # Distance between the requested and the true rank of each sketch quantile, the usual sketch error measure
+    order = np.argsort(values, kind="stable")
+    sorted_values = np.asarray(values, dtype=np.float64)[order]
+    cumulative = np.cumsum(np.asarray(weights, dtype=np.float64)[order])
+    total = cumulative[-1]
+    errors = {}
+    for q, value in sketch_quantiles.items():
+        below = cumulative[np.searchsorted(sorted_values, value, side="left") - 1] if value > sorted_values[0] else 0.0
+        at_or_below = cumulative[np.searchsorted(sorted_values, value, side="right") - 1]
+        # Any rank between the weight strictly below and the weight at or below the value is correct
+        target = q * total
+        errors[q] = float(max(below - target, target - at_or_below, 0.0) / total)
+    return errors
@@ -0,0 +1,199 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+SUMMARY_QUANTILES = (0.25, 0.5, 0.75)
+
+# Histogram responses: width of a price per square meter bin, and the most bins sent before bins are widened
+SUMMARY_BIN_WIDTH = 10.0
+SUMMARY_MAX_BINS = 4096
+
+
+class PriceSummary(NamedTuple):
+    midpoints: np.ndarray
+    # Number of transactions behind each midpoint, None when every midpoint is one transaction
+    weights: Optional[np.ndarray]
+    count: int
+    mean: float
+    median: float
+    q25: float
+    q75: float
+    min: float
+    max: float
+    # KDE bandwidth from the exact moments, for summaries of histograms whose bins would give a wrong one
+    bandwidth: Optional[float] = None
+
+
+def transaction_count(transactions):
+    # Total number of sales, for lists as well as NumPy arrays decoded from the backend
+    return int(np.sum(transactions, dtype=np.int64))
+
+
+def price_midpoints(min_prices_per_square_meter, max_prices_per_square_meter):
+    # Average price per square meter of each transaction, as one float64 array
+    min_prices = np.asarray(min_prices_per_square_meter, dtype=np.float64)
+    max_prices = np.asarray(max_prices_per_square_meter, dtype=np.float64)
+    return (min_prices + max_prices) * 0.5
+
+
+def _quantiles(values: np.ndarray, quantiles):
+    # Linearly interpolated quantiles (the pandas default) plus min and max from a single partition
+    n = len(values)
+    positions = np.asarray(quantiles, dtype=np.float64) * (n - 1)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.ceil(positions).astype(np.intp)
+    kth = np.unique(np.concatenate(([0, n - 1], lower, upper)))
+    partitioned = np.partition(values, kth)
+    results = partitioned[lower] + (partitioned[upper] - partitioned[lower]) * (positions - lower)
+    return results, partitioned[0], partitioned[n - 1]
+
+
+def weighted_quantiles(values: np.ndarray, weights: np.ndarray, quantiles):
+    # Quantiles of the values repeated weight times, found through cumulative counts without repeating them
+    order = np.argsort(values, kind="stable")
+    sorted_values = values[order]
+    cumulative = np.cumsum(weights[order])
+    positions = np.asarray(quantiles, dtype=np.float64) * (cumulative[-1] - 1)
+    lower = np.floor(positions)
+    lower_values = sorted_values[np.searchsorted(cumulative, lower, side="right")]
+    upper_values = sorted_values[np.searchsorted(cumulative, np.ceil(positions), side="right")]
+    results = lower_values + (upper_values - lower_values) * (positions - lower)
+    return results, sorted_values[0], sorted_values[-1]
+
+
+def summarize_prices(min_prices_per_square_meter, max_prices_per_square_meter, transactions=None):
+    # Statistics over the transactions: with counts given, each midpoint stands for that many sales
+    midpoints = price_midpoints(min_prices_per_square_meter, max_prices_per_square_meter)
+    weights = None
+    if transactions is not None:
+        weights = np.asarray(transactions, dtype=np.float64)
+        if np.all(weights == 1):
+            weights = None
+        else:
+            present = weights > 0
+            midpoints = midpoints[present]
+            weights = weights[present]
+
+    if len(midpoints) == 0:
+        raise ValueError("Cannot summarize an empty set of prices")
+
+    if weights is None:
+        (q25, median, q75), min_value, max_value = _quantiles(midpoints, SUMMARY_QUANTILES)
+        count = len(midpoints)
+        mean = midpoints.mean()
+    else:
+        (q25, median, q75), min_value, max_value = weighted_quantiles(midpoints, weights, SUMMARY_QUANTILES)
+        count = int(round(weights.sum()))
+        mean = np.dot(weights, midpoints) / weights.sum()
+
+    return PriceSummary(
+        midpoints=midpoints,
+        weights=weights,
+        count=count,
+        mean=float(mean),
+        median=float(median),
+        q25=float(q25),
+        q75=float(q75),
+        min=float(min_value),
+        max=float(max_value),
+    )
+
+
+def price_histogram(midpoints, weights=None, bin_width: float = SUMMARY_BIN_WIDTH, max_bins: int = SUMMARY_MAX_BINS):
+    # Fixed-width histogram of the prices with their exact moments and extremes, so its size is O(bins)
+    # however many transactions match. The variance and effective sample size are the ones the KDE
+    # bandwidth rules use, so the client gets the same bandwidth as from every transaction
+    midpoints = np.asarray(midpoints, dtype=np.float64)
+    weights = np.ones(len(midpoints)) if weights is None else np.asarray(weights, dtype=np.float64)
+    present = weights > 0
+    midpoints = midpoints[present]
+    weights = weights[present]
+    if len(midpoints) == 0:
+        return {"bin_start": 0.0, "bin_width": float(bin_width), "counts": np.zeros(0, dtype=np.int64), "count": 0}
+
+    total = weights.sum()
+    normalized = weights / total
+    mean = np.dot(normalized, midpoints)
+    squared_weights = np.dot(normalized, normalized)
+    variance = np.dot(normalized, (midpoints - mean) ** 2) / (1 - squared_weights) if squared_weights < 1 else 0.0
+    min_value = midpoints.min()
+    max_value = midpoints.max()
+    bin_start, bin_width, counts = histogram_bins(midpoints, weights, min_value, max_value, bin_width, max_bins)
+
+    return {
+        "bin_start": float(bin_start),
+        "bin_width": float(bin_width),
+        "counts": np.rint(counts).astype(np.int64),
+        "count": int(round(total)),
+        "mean": float(mean),
+        "variance": float(variance),
+        "effective_sample_size": float(1 / squared_weights),
+        "min": float(min_value),
+        "max": float(max_value),
+    }
+
+
+def histogram_bins(values, weights, min_value: float, max_value: float, bin_width: float, max_bins: int = SUMMARY_MAX_BINS):
+    # Weighted counts of bins of bin_width aligned to multiples of it and covering min_value to max_value,
+    # widened to a multiple of bin_width when there would be more than max_bins of them
+    scale = 1
+    while True:
+        width = bin_width * scale
+        bin_start = np.floor(min_value / width) * width
+        num_bins = int((max_value - bin_start) // width) + 1
+        if num_bins <= max_bins:
+            break
+        # Aligning to the wider bins can add a bin at the start, so widen again until they fit
+        scale = max(scale + 1, int(np.ceil(scale * num_bins / max_bins)))
+    bins = np.clip(((values - bin_start) // width).astype(np.intp), 0, num_bins - 1)
+    return bin_start, width, np.bincount(bins, weights=weights, minlength=num_bins)
+
+
+def summarize_histogram(response_data):
+    # Statistics from a histogram response: exact count, mean and extremes, quantiles within a bin width
+    counts = np.asarray(response_data["counts"], dtype=np.float64)
+    if response_data["count"] == 0:
+        raise ValueError("Cannot summarize an empty set of prices")
+
+    edges = response_data["bin_start"] + response_data["bin_width"] * np.arange(len(counts) + 1)
+    min_value, max_value = response_data["min"], response_data["max"]
+    # Quantiles assuming the prices of a bin are spread evenly over it
+    cumulative = np.concatenate(([0.0], np.cumsum(counts)))
+    q25, median, q75 = np.interp(np.asarray(SUMMARY_QUANTILES) * cumulative[-1], cumulative, edges)
+
+    centers = (edges[:-1] + edges[1:]) / 2
+    present = counts > 0
+    centers = centers[present]
+    counts = counts[present]
+    bandwidth = np.sqrt(response_data["variance"]) * response_data["effective_sample_size"] ** (-1 / 5)
+
+    return PriceSummary(
+        midpoints=centers,
+        weights=counts,
+        count=int(response_data["count"]),
+        mean=float(response_data["mean"]),
+        median=float(np.clip(median, min_value, max_value)),
+        q25=float(np.clip(q25, min_value, max_value)),
+        q75=float(np.clip(q75, min_value, max_value)),
+        min=float(min_value),
+        max=float(max_value),
+        bandwidth=float(bandwidth),
+    )
+
+
+# Responses of the price per square meter endpoint are a histogram when the backend honoured
+# mode "summary", and one row per price group otherwise
+def response_sample_size(response_data):
+    if "counts" in response_data:
+        return int(response_data["count"])
+    return transaction_count(response_data["transactions"])
+
+
+def summarize_response(response_data):
+    if "counts" in response_data:
+        return summarize_histogram(response_data)
+    return summarize_prices(
+        response_data["min_prices_per_square_meter"],
+        response_data["max_prices_per_square_meter"],
+        response_data["transactions"],
+    )
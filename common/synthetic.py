@@ -0,0 +1,104 @@
+import numpy as np
+
+# City: (postal code prefix, number of postal codes, median price per square meter, share of transactions)
+CITY_PROFILES = {
+    "helsinki": ("00", 90, 5200, 0.30),
+    "espoo": ("02", 60, 4300, 0.14),
+    "vantaa": ("01", 50, 3200, 0.10),
+    "tampere": ("33", 50, 3300, 0.11),
+    "turku": ("20", 40, 2900, 0.07),
+    "oulu": ("90", 40, 2400, 0.06),
+    "jyvaskyla": ("40", 30, 2600, 0.05),
+    "kuopio": ("70", 25, 2500, 0.04),
+    "lahti": ("15", 25, 2200, 0.035),
+    "joensuu": ("80", 15, 2000, 0.02),
+    "kouvola": ("45", 15, 1400, 0.015),
+    "porvoo": ("06", 10, 2600, 0.012),
+    "jarvenpaa": ("04", 8, 2700, 0.012),
+    "kerava": ("04", 6, 2700, 0.01),
+    "tuusula": ("04", 6, 2600, 0.008),
+    "kauniainen": ("02", 2, 4800, 0.008),
+}
+
+# Room category spellings as they appear in the data, with typical sizes in square meters
+ROOM_CATEGORIES = (
+    ("Yksiö", 32, 0.18),
+    ("Yksiöt", 32, 0.07),
+    ("Kaksiot", 52, 0.22),
+    ("Kaksi huonetta", 54, 0.13),
+    ("Kolmiot", 74, 0.14),
+    ("Kolme huonetta", 76, 0.08),
+    ("Neljä huonetta tai enemmän", 105, 0.18),
+)
+BUILDING_TYPES = (("kt", 1.0, 0.65), ("rt", 0.92, 0.22), ("ok", 0.85, 0.13))
+STATES = (("hyvä", 1.08, 0.55), ("tyyd.", 0.95, 0.35), ("huono", 0.8, 0.10))
+PLOT_OWNERSHIPS = (("oma", 1.0, 0.85), ("vuokra", 0.9, 0.15))
+
+
+# Newest build year and last sale year of the generated data. Fixed rather than the current year, so a seed
+# generates the same transactions, and snapshot versions built from it stay valid, from one year to the next
+REFERENCE_YEAR = 2024
+
+
+def _choose(rng, options, size):
+    weights = np.array([option[-1] for option in options], dtype=np.float64)
+    return rng.choice(len(options), size=size, p=weights / weights.sum())
+
+
+def generate_transactions(num_rows: int, seed: int = 0, reference_year: int = REFERENCE_YEAR):
+    # Seeded synthetic Finnish apartment transactions, in the column layout of a local snapshot
+    rng = np.random.default_rng(seed)
+    cities = list(CITY_PROFILES)
+    city_index = _choose(rng, list(CITY_PROFILES.values()), num_rows)
+
+    postal_codes = np.empty(num_rows, dtype="<U5")
+    base_prices = np.empty(num_rows)
+    for index, city in enumerate(cities):
+        prefix, num_codes, median_price, _ = CITY_PROFILES[city]
+        rows = np.flatnonzero(city_index == index)
+        # Postal codes of a city are multiples of ten after its prefix; some areas are pricier than others
+        area = rng.integers(0, num_codes, len(rows))
+        offset = sum(1 for other in cities[:index] if CITY_PROFILES[other][0] == prefix) * 100
+        postal_codes[rows] = [f"{prefix}{(offset + code * 10) % 1000:03d}" for code in area]
+        area_factor = np.exp(rng.normal(0, 0.25, num_codes))[area]
+        base_prices[rows] = median_price * area_factor
+
+    room_index = _choose(rng, ROOM_CATEGORIES, num_rows)
+    building_index = _choose(rng, BUILDING_TYPES, num_rows)
+    state_index = _choose(rng, STATES, num_rows)
+    ownership_index = _choose(rng, PLOT_OWNERSHIPS, num_rows)
+
+    typical_sizes = np.array([room[1] for room in ROOM_CATEGORIES], dtype=np.float64)
+    square_meters = np.round(np.clip(typical_sizes[room_index] * np.exp(rng.normal(0, 0.18, num_rows)), 12, 400), 1)
+    year_built = np.clip(np.round(rng.normal(1978, 22, num_rows)), 1880, reference_year).astype(np.int32)
+
+    # Older buildings and bigger apartments are cheaper per square meter, new ones carry a premium
+    age_factor = np.where(year_built >= 2015, 1.25, 1.0) * (1 - np.clip(2015 - year_built, 0, 60) * 0.004)
+    size_factor = (square_meters / 55) ** -0.12
+    price_per_square_meter = (
+        base_prices
+        * age_factor
+        * size_factor
+        * np.array([item[1] for item in BUILDING_TYPES])[building_index]
+        * np.array([item[1] for item in STATES])[state_index]
+        * np.array([item[1] for item in PLOT_OWNERSHIPS])[ownership_index]
+        * np.exp(rng.normal(0, 0.15, num_rows))
+    )
+    # Each row is a bucket of sales with a small spread of prices
+    spread = price_per_square_meter * rng.uniform(0, 0.06, num_rows)
+
+    return {
+        "postal_code": postal_codes,
+        "city": np.array(cities)[city_index],
+        "plot_ownership": np.array([item[0] for item in PLOT_OWNERSHIPS])[ownership_index],
+        "room_category": np.array([item[0] for item in ROOM_CATEGORIES])[room_index],
+        "building_type": np.array([item[0] for item in BUILDING_TYPES])[building_index],
+        "state": np.array([item[0] for item in STATES])[state_index],
+        "year_built": year_built,
+        "square_meters": square_meters,
+        "min_price_per_square_meter": np.round(price_per_square_meter - spread / 2),
+        "max_price_per_square_meter": np.round(price_per_square_meter + spread / 2),
+        "transactions": rng.geometric(0.6, num_rows).astype(np.int32),
+        "price": np.round(price_per_square_meter * square_meters, -2),
+        "sale_year": rng.integers(reference_year - 5, reference_year + 1, num_rows).astype(np.int32),
+    }
@@ -8,9 +8,15 @@ from estimate_square_meter_price.helpers import (
     generate_key,
     display_kde_plot,
 )
-import pandas as pd
+from common.api import describe_freshness, last_fetch, price_query_payload
+from common.debug_panel import render_debug_panel
+from common.instrumentation import span
+from common.profiling import profile_rerun
+from common.query_params import CITY_OPTIONS
+from common.statistics import response_sample_size, summarize_response
 
 
+@profile_rerun("estimate")
 def render_price_per_square_meter_estimations_tab():
     st.markdown(
         "<h2 style='text-align: center;'>Price per Square Meter Estimation</h2>",
@@ -88,32 +94,13 @@ def render_price_per_square_meter_estimations_tab():
 
 
     st.markdown("<hr style='border: 1px solid #ccc;'>", unsafe_allow_html=True)
-    # Define the list of cities
-    cities = [
-        "espoo",
-        "vantaa",
-        "helsinki",
-        "tampere",
-        "jarvenpaa",
-        "kerava",
-        "jyvaskyla",
-        "oulu",
-        "kuopio",
-        "joensuu",
-        "turku",
-        "kouvola",
-        "lahti",
-        "porvoo",
-        "tuusula",
-        "kauniainen",
-    ]
     st.markdown(
         "<h5 style='text-align: center;'>Select city:</h5>", unsafe_allow_html=True
     )
     # Add a multiselect widget to select cities
     selected_cities = st.multiselect(
         "Select cities",
-        options=cities,
+        options=CITY_OPTIONS,
         default=None,
         label_visibility="hidden",
         key=generate_key("selected_cities"),
@@ -280,40 +267,25 @@ def render_price_per_square_meter_estimations_tab():
             process_postal_codes,
         )
 
-        payload = {"where_clause": where_clause}
+        payload = price_query_payload(where_clause)
 
         response_data, error = call_api(payload)
         if error:
             st.error(f"API call failed: {error}")
         else:
-            avg_prices_per_square_meter = [
-                (min_price + max_price) / 2
-                for min_price, max_price in zip(
-                    response_data["min_prices_per_square_meter"],
-                    response_data["max_prices_per_square_meter"],
-                )
-            ]
-            transactions = response_data["transactions"]
-            sample_size = sum(transactions)
+            sample_size = response_sample_size(response_data)
             if sample_size > 4:
-                mean_value = pd.Series(avg_prices_per_square_meter).mean()
-                median_value = pd.Series(avg_prices_per_square_meter).median()
-                q25_value = pd.Series(avg_prices_per_square_meter).quantile(0.25)
-                q75_value = pd.Series(avg_prices_per_square_meter).quantile(0.75)
-                min_value = min(avg_prices_per_square_meter)
-                max_value = max(avg_prices_per_square_meter)
-                min_prices = response_data["min_prices_per_square_meter"]
-                max_prices = response_data["max_prices_per_square_meter"]
+                # Only sent when the backend answered with every transaction instead of a histogram
+                min_prices = response_data.get("min_prices_per_square_meter")
+                max_prices = response_data.get("max_prices_per_square_meter")
+                with span("estimate", "stats"):
+                    summary = summarize_response(response_data)
                 st.session_state.plots = {
                     "min_prices": min_prices,
                     "max_prices": max_prices,
-                    "mean_value": mean_value,
-                    "median_value": median_value,
-                    "q25_value": q25_value,
-                    "q75_value": q75_value,
-                    "min_value": min_value,
-                    "max_value": max_value,
+                    "summary": summary,
                     "sample_size": sample_size,
+                    "freshness": last_fetch(),
                 }
             else:
                 st.session_state.plots = None
@@ -331,18 +303,19 @@ def render_price_per_square_meter_estimations_tab():
     if st.session_state.plots:
         min_prices = st.session_state.plots["min_prices"]
         max_prices = st.session_state.plots["max_prices"]
-        mean_value = st.session_state.plots["mean_value"]
-        median_value = st.session_state.plots["median_value"]
-        q25_value = st.session_state.plots["q25_value"]
-        q75_value = st.session_state.plots["q75_value"]
-        min_value = st.session_state.plots["min_value"]
-        max_value = st.session_state.plots["max_value"]
+        summary = st.session_state.plots["summary"]
         sample_size = st.session_state.plots["sample_size"]
+        mean_value = summary.mean
+        median_value = summary.median
+        q25_value = summary.q25
+        q75_value = summary.q75
+        min_value = summary.min
+        max_value = summary.max
 
         # Display the plot at the top
         with top_plot_placeholder:
             if sample_size > 4:
-                display_kde_plot(min_prices, max_prices, "top")
+                display_kde_plot(min_prices, max_prices, "top", summary)
 
             with top_text_placeholder:
                 st.markdown(
@@ -361,7 +334,7 @@ def render_price_per_square_meter_estimations_tab():
 
         if sample_size > 4:
             # Display the plot at the bottom
-            display_kde_plot(min_prices, max_prices, "bottom")
+            display_kde_plot(min_prices, max_prices, "bottom", summary)
             st.markdown(
                 f"""
                 <h6 style='text-align: left; color: red;'>Average square meter price: {format_currency(mean_value)} <br>
@@ -375,6 +348,7 @@ def render_price_per_square_meter_estimations_tab():
                 """,
                 unsafe_allow_html=True,
             )
+            st.caption(describe_freshness(st.session_state.plots["freshness"]))
 
     else:
         with top_text_placeholder:
@@ -387,3 +361,6 @@ def render_price_per_square_meter_estimations_tab():
                 """,
                 unsafe_allow_html=True,
             )
+
+    # Stage timings, shown only with ?debug=1 in the URL
+    render_debug_panel(generate_key("debug"))
@@ -1,13 +1,15 @@
 import streamlit as st
-from datetime import datetime
 from experimental.helpers import (
-    process_postal_codes,
-    call_api,
-    build_where_clause,
+    call_api_if_changed,
+    describe_last_call,
+    generate_key,
     display_kde_plot,
-    string_to_list,
 )
-import pandas as pd
+from common.api import price_query_payload
+from common.query_params import query_params_to_filter
+from common.instrumentation import span
+from common.profiling import profile_rerun
+from common.statistics import response_sample_size, summarize_response
 
 
 def show_popup():
@@ -27,66 +29,15 @@ def show_popup():
         unsafe_allow_html=True
     )
 
+@profile_rerun("estimation")
 def display_estimation(query_params):
-    postal_codes_input_text = query_params.get('postal_code', [])
-
-    current_year = datetime.now().year
-    end_year = current_year + 2
-    selected_start_year = query_params.get('start_year', 1880)
-    selected_end_year = query_params.get('end_year', end_year)
-    if (int(selected_end_year) - int(selected_start_year)) < 5:
-        selected_start_year = str(int(selected_start_year) - 2)
-        selected_end_year = str(int(selected_end_year) + 2)
-
-    selected_min_square_meter = query_params.get('min_m2', 25)
-    selected_max_square_meter = query_params.get('max_m2', 85)
-    if (int(selected_max_square_meter) - int(selected_min_square_meter)) < 4:
-        selected_min_square_meter = str(int(selected_min_square_meter) - 2)
-        selected_max_square_meter = str(int(selected_max_square_meter) + 2)
-
-    selected_cities = string_to_list(query_params.get('cities', None))
-
-    selected_property_ownership_options = string_to_list(query_params.get('ownership_types', None))
-
-    selected_room_number_input = string_to_list(query_params.get('room_numbers', None))
-
-    # Display the selected options
-    selected_room_number_options = []
-    if '1' in selected_room_number_input:
-        selected_room_number_options.extend(["Yksiö", "Yksiöt"])
-    if '2' in selected_room_number_input:
-        selected_room_number_options.extend(["Kaksiot", "Kaksi huonetta"])
-    if '3' in selected_room_number_input:
-        selected_room_number_options.extend(["Kolmiot", "Kolme huonetta"])
-    if '4' in selected_room_number_input:
-        selected_room_number_options.append("Neljä huonetta tai enemmän")
-
-    selected_property_type_options = string_to_list(query_params.get('prop_type', None))
-
-    selected_room_number_input = string_to_list(query_params.get('condition', None))
-    selected_property_condition_options = []
-    if "good" in selected_room_number_input:
-        selected_property_condition_options.append("hyvä")
-    if "ok" in selected_room_number_input:
-        selected_property_condition_options.append("tyyd.")
-    if "bad" in selected_room_number_input:
-        selected_property_condition_options.append("huono")
-
-    where_clause = build_where_clause(
-        postal_codes_input_text,
-        [selected_start_year, selected_end_year],
-        [selected_min_square_meter, selected_max_square_meter],
-        selected_cities,
-        selected_property_ownership_options,
-        selected_room_number_options,
-        selected_property_type_options,
-        selected_property_condition_options,
-        process_postal_codes,
-    )
+    query_filter, error = query_params_to_filter(query_params, widen_narrow_ranges=True)
+    if error:
+        st.error(error)
 
-    payload = {"where_clause": where_clause}
+    payload = price_query_payload(query_filter.to_where_clause())
 
-    response_data, error = call_api(payload)
+    response_data, error, _ = call_api_if_changed(payload, generate_key("estimation_last_call"))
     if error:
         return st.markdown(
             f"""
@@ -98,26 +49,17 @@ def display_estimation(query_params):
             unsafe_allow_html=True,
         )
     else:
-        avg_prices_per_square_meter = [
-            (min_price + max_price) / 2
-            for min_price, max_price in zip(
-                response_data["min_prices_per_square_meter"],
-                response_data["max_prices_per_square_meter"],
-            )
-        ]
-        transactions = response_data["transactions"]
-        sample_size = sum(transactions)
+        sample_size = response_sample_size(response_data)
         if sample_size > 4:
-            mean_value = pd.Series(avg_prices_per_square_meter).mean()
-            median_value = pd.Series(avg_prices_per_square_meter).median()
-            q25_value = pd.Series(avg_prices_per_square_meter).quantile(0.25)
-            q75_value = pd.Series(avg_prices_per_square_meter).quantile(0.75)
-            min_value = min(avg_prices_per_square_meter)
-            max_value = max(avg_prices_per_square_meter)
-            min_prices = response_data["min_prices_per_square_meter"]
-            max_prices = response_data["max_prices_per_square_meter"]
-
-            return display_kde_plot(min_prices, max_prices, "top")
+            # Only sent when the backend answered with every transaction instead of a histogram
+            min_prices = response_data.get("min_prices_per_square_meter")
+            max_prices = response_data.get("max_prices_per_square_meter")
+            with span("experimental", "stats"):
+                summary = summarize_response(response_data)
+
+            plot = display_kde_plot(min_prices, max_prices, "top", summary)
+            st.caption(describe_last_call(generate_key("estimation_last_call")))
+            return plot
 
         else:
             show_popup()
@@ -1,95 +1,48 @@
 import streamlit as st
-import requests
 from typing import List
-import pandas as pd
-import plotly.figure_factory as ff
+import numpy as np
+from common.api import PRICE_PER_SQUARE_METER_PATH, call_backend, describe_freshness, is_stale, last_fetch, payload_fingerprint
+from common.config import backend_url
+from common.figure_cache import array_fingerprint, cached_figure
+from common.instrumentation import span
+from common.kde import kde_figure
+from common.statistics import PriceSummary, summarize_prices
 
 
-def string_to_list(input_string):
-    # Check if the string is empty after removing brackets
-    if not input_string:
-        return []
-
-    # Split the string by commas and strip whitespace from each element
-    result_list = [item.strip() for item in input_string.split(',')]
-
-    return result_list
-
 def generate_key(unique_str: str):
     return str(f"experimental-{unique_str}")
 
-def build_where_clause(
-    postal_codes_input_text,
-    selected_built_year_range,
-    selected_square_meter_range,
-    selected_cities,
-    selected_property_ownership_options,
-    selected_room_number_options,
-    selected_property_type_options,
-    selected_property_condition_options,
-    process_postal_codes
-):
-    where_clause = []
-
-    # Process the input and validate it
-    if postal_codes_input_text:
-        postal_codes, error = process_postal_codes(postal_codes_input_text)
-        if error:
-            st.error(error)
-        else:
-            postal_code_sql = "postal_code in ({})".format(", ".join("'{}'".format(postal_code) for postal_code in postal_codes))
-            where_clause.append(postal_code_sql)
-
-    built_year_range_sql = [f"year_built >= {selected_built_year_range[0]}", f"year_built <= {selected_built_year_range[1]}"]
-    square_meter_range_sql = [f"square_meters >= {selected_square_meter_range[0]}", f"square_meters <= {selected_square_meter_range[1]}"]
-    where_clause.extend(built_year_range_sql)
-    where_clause.extend(square_meter_range_sql)
-
-    if selected_cities:
-        selected_cities_sql = "city in ({})".format(", ".join("'{}'".format(city) for city in selected_cities))
-        where_clause.append(selected_cities_sql)
-
-    if selected_property_ownership_options:
-        property_ownership_sql = "plot_ownership in ({})".format(", ".join("'{}'".format(ownership_type) for ownership_type in selected_property_ownership_options))
-        where_clause.append(property_ownership_sql)
-
-    if selected_room_number_options:
-        room_number_sql = "room_category in ({})".format(", ".join("'{}'".format(room_number) for room_number in selected_room_number_options))
-        where_clause.append(room_number_sql)
-
-    if selected_property_type_options:
-        building_type_sql = "building_type in ({})".format(", ".join("'{}'".format(building_type) for building_type in selected_property_type_options))
-        where_clause.append(building_type_sql)
-
-    if selected_property_condition_options:
-        property_condition_sql = "state in ({})".format(", ".join("'{}'".format(state) for state in selected_property_condition_options))
-        where_clause.append(property_condition_sql)
-
-    return where_clause
-
-
-api_url = "http://51.20.64.222:8000/get-price-per-square-meters/"
+api_url = f"{backend_url}{PRICE_PER_SQUARE_METER_PATH}"
 
 # Function to call the API
 def call_api(payload):
-    try:
-        response = requests.post(api_url, json=payload)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        return response.json(), None
-    except requests.exceptions.RequestException as e:
-        return None, str(e)
+    with span("experimental", "call_api"):
+        return call_backend(api_url, payload)
 
 
-def process_postal_codes(input_text):
-    # Split the input text by commas
-    postal_codes = [code.strip() for code in input_text.split(",")]
+# Fetch only when the filters differ from the last successful call of this session,
+# so reruns caused by widget interactions or resizes re-render from memory.
+# A stale response is looked up again, to pick up the copy refreshed in the background
+def call_api_if_changed(payload, state_key: str):
+    fingerprint = payload_fingerprint(api_url, payload)
+    last_call = st.session_state.get(state_key)
+    same_filters = last_call is not None and last_call["fingerprint"] == fingerprint
+    if same_filters and not is_stale(last_call["freshness"]):
+        return last_call["response_data"], None, False
 
-    # Validate each postal code
-    for code in postal_codes:
-        if not code.isdigit() or len(code) != 5:
-            return None, f"Invalid postal code: {code}"
+    response_data, error = call_api(payload)
+    if error is not None:
+        return response_data, error, True
 
-    return postal_codes, None
+    changed = not same_filters or response_data is not last_call["response_data"]
+    st.session_state[state_key] = {"fingerprint": fingerprint, "response_data": response_data, "freshness": last_fetch()}
+    return response_data, None, changed
+
+
+# Age of the data of the last successful call of this session
+def describe_last_call(state_key: str):
+    last_call = st.session_state.get(state_key)
+    return describe_freshness(last_call["freshness"]) if last_call else ""
 
 
 def format_currency(value):
@@ -102,23 +55,9 @@ def format_currency(value):
     return formatted_value
 
 
-def display_kde_plot(min_prices_per_square_meter: List[float], max_prices_per_square_meter: List[float], key: str):
-    # Calculate the average price per square meter for each transaction
-    avg_prices_per_square_meter = [
-        (min_price + max_price) / 2
-        for min_price, max_price in zip(min_prices_per_square_meter, max_prices_per_square_meter)
-    ]
-
-    # Calculate statistics
-    mean_value = pd.Series(avg_prices_per_square_meter).mean()
-    median_value = pd.Series(avg_prices_per_square_meter).median()
-    q25_value = pd.Series(avg_prices_per_square_meter).quantile(0.25)
-    q75_value = pd.Series(avg_prices_per_square_meter).quantile(0.75)
-    min_value = min(avg_prices_per_square_meter)
-    max_value = max(avg_prices_per_square_meter)
-
-    # Create the KDE plot
-    fig = ff.create_distplot([avg_prices_per_square_meter], group_labels=['Average Price per Square Meter'], show_hist=False, show_rug=False)
+def build_kde_figure(summary: PriceSummary):
+    # Create the KDE plot, exact for small unweighted samples and binned otherwise
+    fig = kde_figure(summary.midpoints, summary.weights, bandwidth=summary.bandwidth)
 
     # Convert density to percentage points and set custom hover text
     for trace in fig.data:
@@ -126,10 +65,10 @@ def display_kde_plot(min_prices_per_square_meter: List[float], max_prices_per_sq
         trace.hovertemplate = 'Price per square meter: %{x:,.0f}<extra></extra>'
 
     # Find the maximum y value of the KDE plot
-    max_y_value = max(y for trace in fig.data for y in trace.y)
+    max_y_value = max(np.max(trace.y) for trace in fig.data)
     # Add vertical lines for the statistics
     for i, (value, label, color) in enumerate(zip(
-            [mean_value, median_value, q25_value, q75_value, min_value, max_value],
+            [summary.mean, summary.median, summary.q25, summary.q75, summary.min, summary.max],
             ['Mean', 'Median', 'Q25', 'Q75', 'Min', 'Max'],
             ['Red', 'Blue', 'Green', 'Green', 'Purple', 'Purple']
     )):
@@ -157,7 +96,7 @@ def display_kde_plot(min_prices_per_square_meter: List[float], max_prices_per_sq
     # Customize the layout
     fig.update_layout(
         title={
-            'text': f'Metrics based on {len(min_prices_per_square_meter)} relevant property transactions',
+            'text': f'Metrics based on {summary.count} relevant property transactions',
             'x': 0.5,  # Center the title
             'xanchor': 'center',  # Anchor the title to the center
             'font': {
@@ -176,5 +115,23 @@ def display_kde_plot(min_prices_per_square_meter: List[float], max_prices_per_sq
     )
 
     fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='LightGray', tickmode='linear', tick0=0, dtick=500)
+    return fig
+
+
+def display_kde_plot(min_prices_per_square_meter: List[float], max_prices_per_square_meter: List[float], key: str, summary: PriceSummary = None):
+    # Reuse the statistics the tab already computed, if given
+    if summary is None:
+        with span("experimental", "stats"):
+            summary = summarize_prices(min_prices_per_square_meter, max_prices_per_square_meter)
+
+    # Identical data gives an identical figure, so build it once and reuse it across reruns and sessions.
+    # Histogram summaries also carry exact statistics that the bins alone do not determine
+    data_key = array_fingerprint(
+        summary.midpoints, summary.weights, [summary.count, summary.mean, summary.min, summary.max, summary.bandwidth or 0.0]
+    )
+    with span("experimental", "figure"):
+        fig = cached_figure("experimental-kde", data_key, lambda: build_kde_figure(summary))
+
     # Display the chart in Streamlit
-    st.plotly_chart(fig, key=key, use_container_width=True)
+    with span("experimental", "plotly_chart"):
+        st.plotly_chart(fig, key=key, use_container_width=True)
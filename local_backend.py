@@ -0,0 +1,165 @@
+import argparse
+import gzip
+import json
+import logging
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from common.columnar import COLUMNAR_MEDIA_TYPE, encode_columns, is_columnar
+from common.local_engine import LocalEngine, TransactionSnapshot
+from common.synthetic import REFERENCE_YEAR, generate_transactions
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Smaller bodies are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+
+class BackendHandler(BaseHTTPRequestHandler):
+    # Set on the server: the engine answering queries, the latency to inject before each response,
+    # whether to offer the binary columnar format and the gzip level (0 disables compression)
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this keep-alive clients wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"detail": "Request body is not valid JSON"})
+
+        latency_ms, jitter_ms = self.server.latency_ms, self.server.latency_jitter_ms
+        if latency_ms or jitter_ms:
+            time.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+
+        response_data, error = self.server.engine.handle(self.path, payload)
+        if error:
+            status = 404 if error.startswith("Unsupported endpoint") else 422
+            return self._send(status, {"detail": error})
+        self._send(200, response_data)
+
+    def _accepted_encodings(self):
+        return {part.split(";")[0].strip() for part in self.headers.get("Accept-Encoding", "").split(",")}
+
+    def _send(self, status: int, body: dict):
+        # Binary columns for clients that ask for them, JSON otherwise; then compressed as the client allows
+        if self.server.binary and COLUMNAR_MEDIA_TYPE in self.headers.get("Accept", "") and is_columnar(body):
+            content_type, encoded = COLUMNAR_MEDIA_TYPE, encode_columns(body)
+        else:
+            content_type, encoded = "application/json", json.dumps(body, default=_json_default).encode("utf-8")
+
+        content_encoding = None
+        if len(encoded) >= MIN_COMPRESS_BYTES:
+            encodings = self._accepted_encodings()
+            if zstandard is not None and "zstd" in encodings:
+                content_encoding, encoded = "zstd", zstandard.ZstdCompressor(level=1).compress(encoded)
+            elif self.server.gzip_level and "gzip" in encodings:
+                content_encoding, encoded = "gzip", gzip.compress(encoded, compresslevel=self.server.gzip_level)
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if content_encoding:
+            self.send_header("Content-Encoding", content_encoding)
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def _json_default(value):
+    # The local engine answers with NumPy arrays and scalars
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def create_server(
+    engine: LocalEngine,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    latency_ms: float = 0,
+    latency_jitter_ms: float = 0,
+    binary: bool = True,
+    gzip_level: int = 1,
+):
+    server = ThreadingHTTPServer((host, port), BackendHandler)
+    server.daemon_threads = True
+    server.engine = engine
+    server.latency_ms = latency_ms
+    server.latency_jitter_ms = latency_jitter_ms
+    server.binary = binary
+    server.gzip_level = gzip_level
+    return server
+
+
+def load_engine(
+    snapshot_path=None, rows: int = 200_000, seed: int = 0, reference_year: int = REFERENCE_YEAR, sketch_cube: bool = False
+):
+    if snapshot_path:
+        snapshot = TransactionSnapshot.load(snapshot_path)
+    else:
+        snapshot = TransactionSnapshot.from_arrays(
+            generate_transactions(rows, seed, reference_year), version=f"synthetic:{rows}:{seed}:{reference_year}"
+        )
+    return LocalEngine(snapshot, build_sketch_cube=sketch_cube)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the valuation backend, serving /get-price-per-square-meters/ and "
+        "/property-price-valuation/ from synthetic or snapshot data. Point the app at it with "
+        "BACKEND_URL=http://127.0.0.1:8000.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--rows", type=int, default=200_000, help="Synthetic transaction rows to generate")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data generator")
+    parser.add_argument(
+        "--reference-year",
+        type=int,
+        default=REFERENCE_YEAR,
+        help="Newest build year and last sale year of the synthetic data",
+    )
+    parser.add_argument("--snapshot", help="Serve this snapshot (.npz, .parquet or .arrow) instead of synthetic data")
+    parser.add_argument(
+        "--sketch-cube", action="store_true", help="Answer summary mode queries from pre-aggregated quantile sketches"
+    )
+    parser.add_argument("--save-snapshot", help="Also save the synthetic data as an .npz snapshot to this path")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latency to add before every response")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0, help="Random +/- variation of the added latency")
+    parser.add_argument(
+        "--no-binary",
+        dest="binary",
+        action="store_false",
+        help="Always answer with JSON, like a backend without the binary columnar format",
+    )
+    parser.add_argument("--gzip-level", type=int, default=1, help="gzip level for clients that accept it, 0 disables")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_args()
+    engine = load_engine(args.snapshot, args.rows, args.seed, args.reference_year, args.sketch_cube)
+    if args.save_snapshot:
+        engine.snapshot.save_npz(args.save_snapshot)
+
+    server = create_server(
+        engine, args.host, args.port, args.latency_ms, args.latency_jitter_ms, args.binary, args.gzip_level
+    )
+    logger.info("Serving %d transaction rows on http://%s:%d", engine.snapshot.num_rows, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,85 +1,116 @@
+import csv
+import io
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import streamlit as st
 import plotly.graph_objs as go
 import numpy as np
-import requests
+from common.api import PROPERTY_VALUATION_PATH, call_backend
+from common.config import backend_url, http_endpoint_pool_sizes
+from common.figure_cache import cached_figure
+# Re-exported for the tab and the benchmarks, which build where clauses through this module
+from common.filter_inputs import build_where_clause  # noqa: F401
+from common.filters import process_postal_codes  # noqa: F401
+from common.instrumentation import span
+from common.query_params import QUERY_PARAM_NAMES, query_params_to_filter
+
+# Defaults of the valuation form, also used for portfolio rows that leave the ranges out
+DEFAULT_BUILT_YEAR_START = 1975
+DEFAULT_SQUARE_METER_RANGE = (25, 85)
+
+PORTFOLIO_RESULT_FIELDS = ("row", *QUERY_PARAM_NAMES, "mean", "standard_deviation", "sample_size", "error")
+# Concurrent valuations of a portfolio, one per pooled connection to the valuation endpoint
+PORTFOLIO_MAX_WORKERS = http_endpoint_pool_sizes["/property-price-valuation/"]
+
+# The plotted density, scaled to peak at 0.5, only depends on (price - mean) / std_dev,
+# so every valuation shifts and stretches the same standard normal curve
+_standard_normal_x = np.linspace(-3, 3, 1000)
+_standard_normal_y = np.exp(-0.5 * _standard_normal_x ** 2)
+_standard_normal_y_scaled = _standard_normal_y / _standard_normal_y.max() * 0.5
 
 
 def generate_key(unique_str: str):
     return str(f"property-valuation-{unique_str}")
 
 
-def build_where_clause(
-    postal_codes_input_text,
-    selected_built_year_range,
-    selected_square_meter_range,
-    selected_cities,
-    selected_property_ownership_options,
-    selected_room_number_options,
-    selected_property_type_options,
-    selected_property_condition_options,
-    process_postal_codes
-):
-    where_clause = []
-
-    # Process the input and validate it
-    if postal_codes_input_text:
-        postal_codes, error = process_postal_codes(postal_codes_input_text)
-        if error:
-            st.error(error)
-        else:
-            postal_code_sql = "postal_code in ({})".format(", ".join("'{}'".format(postal_code) for postal_code in postal_codes))
-            where_clause.append(postal_code_sql)
-
-    built_year_range_sql = [f"year_built >= {selected_built_year_range[0]}", f"year_built <= {selected_built_year_range[1]}"]
-    square_meter_range_sql = [f"square_meters >= {selected_square_meter_range[0]}", f"square_meters <= {selected_square_meter_range[1]}"]
-    where_clause.extend(built_year_range_sql)
-    where_clause.extend(square_meter_range_sql)
-
-    if selected_cities:
-        selected_cities_sql = "city in ({})".format(", ".join("'{}'".format(city) for city in selected_cities))
-        where_clause.append(selected_cities_sql)
-
-    if selected_property_ownership_options:
-        property_ownership_sql = "plot_ownership in ({})".format(", ".join("'{}'".format(ownership_type) for ownership_type in selected_property_ownership_options))
-        where_clause.append(property_ownership_sql)
-
-    if selected_room_number_options:
-        room_number_sql = "room_category in ({})".format(", ".join("'{}'".format(room_number) for room_number in selected_room_number_options))
-        where_clause.append(room_number_sql)
-
-    if selected_property_type_options:
-        building_type_sql = "building_type in ({})".format(", ".join("'{}'".format(building_type) for building_type in selected_property_type_options))
-        where_clause.append(building_type_sql)
-
-    if selected_property_condition_options:
-        property_condition_sql = "state in ({})".format(", ".join("'{}'".format(state) for state in selected_property_condition_options))
-        where_clause.append(property_condition_sql)
-
-    return where_clause
-
-
-api_url = "http://51.20.64.222:8000/property-price-valuation/"
+api_url = f"{backend_url}{PROPERTY_VALUATION_PATH}"
 
 # Function to call the API
 def call_api(payload):
-    try:
-        response = requests.post(api_url, json=payload)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        return response.json(), None
-    except requests.exceptions.RequestException as e:
-        return None, str(e)
-
-
-def process_postal_codes(input_text):
-    # Split the input text by commas
-    postal_codes = [code.strip() for code in input_text.split(",")]
+    with span("valuation", "call_api"):
+        return call_backend(api_url, payload)
 
-    # Validate each postal code
-    for code in postal_codes:
-        if not code.isdigit() or len(code) != 5:
-            return None, f"Invalid postal code: {code}"
 
-    return postal_codes, None
+def read_portfolio(uploaded_file):
+    # One property per row, described with the query parameters of the estimation page
+    try:
+        rows = csv.DictReader(io.TextIOWrapper(uploaded_file, encoding="utf-8-sig"))
+        return [
+            {name: value.strip() for name, value in row.items() if name in QUERY_PARAM_NAMES and value and value.strip()}
+            for row in rows
+        ], None
+    except (UnicodeDecodeError, csv.Error) as e:
+        return None, f"Could not read the CSV file, it must be UTF-8 encoded: {e}"
+
+
+def portfolio_defaults():
+    return {
+        "start_year": str(DEFAULT_BUILT_YEAR_START),
+        "end_year": str(datetime.now().year),
+        "min_m2": str(DEFAULT_SQUARE_METER_RANGE[0]),
+        "max_m2": str(DEFAULT_SQUARE_METER_RANGE[1]),
+    }
+
+
+def value_property(row_number: int, query_params: dict):
+    result = {"row": row_number, **query_params}
+    # A malformed number, e.g. start_year=19x0, fails only its own row
+    try:
+        query_filter, error = query_params_to_filter({**portfolio_defaults(), **query_params})
+    except ValueError as e:
+        error = f"Invalid query parameters: {e}"
+    if error:
+        result["error"] = error
+        return result
+
+    response_data, error = call_api({"where_clause": query_filter.to_where_clause()})
+    if error:
+        result["error"] = error
+        return result
+
+    result["mean"] = response_data["mean"]
+    result["standard_deviation"] = response_data["standard_deviation"]
+    result["sample_size"] = response_data["sample_size"]
+    return result
+
+
+# Value every property concurrently on a bounded pool, reporting progress from the calling thread
+def value_portfolio(properties, on_progress=None, max_workers: int = PORTFOLIO_MAX_WORKERS):
+    results = [None] * len(properties)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(value_property, row_number, query_params): row_number - 1
+            for row_number, query_params in enumerate(properties, start=1)
+        }
+        for completed, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            # An unexpected failure of one property must not discard the valuations already done
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = {"row": index + 1, **properties[index], "error": str(e)}
+            if on_progress:
+                on_progress(completed, len(properties))
+    return results
+
+
+def portfolio_to_csv(results):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=PORTFOLIO_RESULT_FIELDS)
+    writer.writeheader()
+    writer.writerows(results)
+    return output.getvalue()
 
 
 def format_currency(value):
@@ -92,26 +123,21 @@ def format_currency(value):
     return formatted_value
 
 
-def plot_normal_distribution(mean, std_dev, sample_size):
-    # Generate data for the normal distribution
-    x = np.linspace(mean - 3 * std_dev, mean + 3 * std_dev, 1000)
-    y = (1 / (std_dev * np.sqrt(2 * np.pi))) * np.exp(-0.5 * ((x - mean) / std_dev) ** 2)
-    y_scaled = y / y.max() * 0.5
+def build_normal_distribution_figure(mean, std_dev, sample_size):
+    # Shift and stretch the standard normal curve to this distribution
+    x = mean + std_dev * _standard_normal_x
 
     # Create the plotly figure
     fig = go.Figure()
 
-    hover_text = [f'The price of {format_currency(val)} has a likelihood of {prob:.0%}' for val, prob in zip(x, y_scaled)]
-
-    # Add the normal distribution curve
+    # Add the normal distribution curve, with hover text formatted in the browser
     fig.add_trace(go.Scatter(
         x=x,
-        y=y_scaled,
+        y=_standard_normal_y_scaled,
         mode='lines',
         name='',
         fill='tozeroy',
-        hovertemplate='%{text}<extra></extra>',
-        text=hover_text,
+        hovertemplate='The price of €%{x:.3~s} has a likelihood of %{y:.0%}<extra></extra>',
     ))
 
     # Update the layout
@@ -133,5 +159,18 @@ def plot_normal_distribution(mean, std_dev, sample_size):
         ),
     )
 
+    return fig
+
+
+def plot_normal_distribution(mean, std_dev, sample_size):
+    # The figure only depends on these three numbers, so repeated valuations reuse it
+    with span("valuation", "figure"):
+        fig = cached_figure(
+            "valuation-normal",
+            (mean, std_dev, sample_size),
+            lambda: build_normal_distribution_figure(mean, std_dev, sample_size),
+        )
+
     # Display the plot in Streamlit
-    st.plotly_chart(fig)
\ No newline at end of file
+    with span("valuation", "plotly_chart"):
+        st.plotly_chart(fig)
\ No newline at end of file
@@ -1,6 +1,9 @@
 import streamlit as st
 from datetime import datetime
-from property_valuation.helpers import process_postal_codes, plot_normal_distribution, format_currency, call_api, build_where_clause, generate_key
+from property_valuation.helpers import DEFAULT_BUILT_YEAR_START, DEFAULT_SQUARE_METER_RANGE, process_postal_codes, plot_normal_distribution, format_currency, call_api, build_where_clause, generate_key, read_portfolio, value_portfolio, portfolio_to_csv
+from common.api import describe_freshness, last_fetch
+from common.debug_panel import render_debug_panel
+from common.query_params import QUERY_PARAM_NAMES
 
 def render_property_valuation_tab():
     st.markdown("<h2 style='text-align: center;'>Find out how much a property is worth:</h2>", unsafe_allow_html=True)
@@ -29,7 +32,7 @@ def render_property_valuation_tab():
         "selected_built_year_range",
         min_value=start_year,
         max_value=end_year,
-        value=(1975, current_year),
+        value=(DEFAULT_BUILT_YEAR_START, current_year),
         step=1,
         label_visibility="hidden",
         key = generate_key("selected_built_year_range"),
@@ -41,7 +44,7 @@ def render_property_valuation_tab():
         "selected_square_meter_range",
         min_value=0,
         max_value=400,
-        value=(25, 85),
+        value=DEFAULT_SQUARE_METER_RANGE,
         step=1,
         label_visibility="hidden",
         key = generate_key("selected_square_meter_range"),
@@ -208,3 +211,41 @@ def render_property_valuation_tab():
                 st.success(f"The most likely price for the property is {format_currency(mean)}")
                 st.success(f"70% of properties like this would be priced between {format_currency(mean-std_dev)} and {format_currency(mean+std_dev)}")
                 st.success(f"This price estimation is based on {sample_size} transactions from the last 2 years")
+                st.caption(describe_freshness(last_fetch()))
+
+    st.markdown("<hr style='border: 1px solid #ccc;'>", unsafe_allow_html=True)
+    st.markdown("<h5 style='text-align: center;'>Value a portfolio:</h5>", unsafe_allow_html=True)
+
+    uploaded_file = st.file_uploader(
+        f"Upload a CSV file with one property per row, using the columns: {', '.join(QUERY_PARAM_NAMES)}. "
+        "Missing built year and square meter ranges default to those of the form above",
+        type="csv",
+        key=generate_key("portfolio_file"),
+    )
+
+    if uploaded_file is not None and st.button("Value Portfolio", key=generate_key("portfolio_button")):
+        properties, error = read_portfolio(uploaded_file)
+        if error:
+            st.error(error)
+        else:
+            progress_bar = st.progress(0.0, text=f"Valuing {len(properties)} properties...")
+
+            def show_progress(completed, total):
+                progress_bar.progress(completed / total, text=f"Valued {completed} of {total} properties")
+
+            st.session_state[generate_key("portfolio_results")] = value_portfolio(properties, on_progress=show_progress)
+
+    # Keep the results across reruns, e.g. the one caused by the download button
+    portfolio_results = st.session_state.get(generate_key("portfolio_results"))
+    if uploaded_file is not None and portfolio_results:
+        st.dataframe(portfolio_results, use_container_width=True)
+        st.download_button(
+            "Download Valuations",
+            portfolio_to_csv(portfolio_results),
+            file_name="portfolio_valuation.csv",
+            mime="text/csv",
+            key=generate_key("portfolio_download"),
+        )
+
+    # Stage timings, shown only with ?debug=1 in the URL
+    render_debug_panel(generate_key("debug"))
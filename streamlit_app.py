@@ -1,5 +1,6 @@
 import streamlit as st
-from experimental.experimental import display_estimation
+from common.cache_warmer import start_cache_warmer
+from common.debug_panel import render_debug_panel, start_app_metrics_export
 
 # Set the page layout to wide
 st.set_page_config(layout="wide")
@@ -25,8 +26,11 @@ query_params = st.query_params.to_dict()
 top_plot_placeholder = st.empty()
 
 # Check if the 'page' parameter is set to 'estimation'
+# The estimation page pulls in NumPy and the HTTP client, so it is only imported when visited
 if query_params.get('page') == 'estimation':
     # Import and run the estimation page
+    from experimental.experimental import display_estimation
+
     top_plot_placeholder = display_estimation(query_params)
 
 else:
@@ -35,4 +39,15 @@ else:
     st.write("Use the navigation to go to different pages.")
     if st.button("Go to Estimation Page"):
         query_params['page'] = 'estimation'
+        from experimental.experimental import display_estimation
+
         top_plot_placeholder = display_estimation(query_params)
+
+# Shown only with ?debug=1 in the URL
+render_debug_panel("app")
+
+# Starts the metrics file writer and/or endpoint once per process, if configured
+start_app_metrics_export()
+
+# Fetches the popular queries in the background once per process, so their first visit is a cache hit
+start_cache_warmer()
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from common import api
+from common.cache import TTLCache
+from common.single_flight import SingleFlight
+
+URL = "http://backend" + api.PRICE_PER_SQUARE_METER_PATH
+WHERE_CLAUSE = [
+    "year_built >= 1965",
+    "year_built <= 1985",
+    "square_meters >= 25",
+    "square_meters <= 85",
+    "city in ('helsinki')",
+    "room_category in ('Kaksi huonetta', 'Kaksiot')",
+]
+PAYLOAD = {"where_clause": WHERE_CLAUSE}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    responses = []
+
+    def fetch(api_url, payload):
+        responses.append(payload)
+        return {"response": len(responses)}, None
+
+    monkeypatch.setattr(api, "fetch", fetch)
+    monkeypatch.setattr(api, "disk_cache", None)
+    monkeypatch.setattr(api, "response_cache", TTLCache(10, 60, 600))
+    monkeypatch.setattr(api, "in_flight_requests", SingleFlight())
+    monkeypatch.setattr(api, "response_cache_ttl_seconds", 60)
+    monkeypatch.setattr(api, "stale_while_revalidate_seconds", 600)
+    return responses
+
+
+def _wait_for_revalidation():
+    for _ in range(500):
+        with api._revalidation_lock:
+            if not api._revalidating:
+                return
+        threading.Event().wait(0.01)
+    raise AssertionError("Revalidation did not finish")
+
+
+def test_repeated_calls_are_cached(backend):
+    assert api.call_backend(URL, PAYLOAD) == ({"response": 1}, None)
+    assert api.call_backend(URL, PAYLOAD) == ({"response": 1}, None)
+    assert len(backend) == 1
+    assert (api.response_cache.hits, api.response_cache.misses) == (1, 1)
+
+
+def test_equivalent_where_clauses_share_one_entry(backend):
+    reordered = list(reversed(WHERE_CLAUSE))
+    # A synonym of the room category and a redundant looser bound select the same rows
+    synonym = WHERE_CLAUSE[:5] + ["room_category in ('Kaksi huonetta')", "year_built >= 1900"]
+
+    assert api.call_backend(URL, PAYLOAD) == ({"response": 1}, None)
+    assert api.call_backend(URL, {"where_clause": reordered}) == ({"response": 1}, None)
+    assert api.call_backend(URL, {"where_clause": synonym}) == ({"response": 1}, None)
+    assert len(backend) == 1
+    assert len(api.response_cache) == 1
+
+    assert api.call_backend(URL, {"where_clause": WHERE_CLAUSE[:5]}) == ({"response": 2}, None)
+    assert api.call_backend(URL, {**PAYLOAD, "mode": "summary"}) == ({"response": 3}, None)
+
+
+def test_stale_entry_is_served_and_revalidated(backend):
+    key = api.payload_fingerprint(URL, PAYLOAD)
+    api.response_cache.put(key, {"response": "stale"}, age=120)
+
+    assert api.call_backend(URL, PAYLOAD) == ({"response": "stale"}, None)
+    assert api.last_fetch()["stale"]
+    _wait_for_revalidation()
+
+    assert len(backend) == 1
+    assert api.call_backend(URL, PAYLOAD) == ({"response": 1}, None)
+    assert not api.last_fetch()["stale"]
+
+
+def test_stale_entry_is_fetched_again_without_allow_stale(backend):
+    key = api.payload_fingerprint(URL, PAYLOAD)
+    api.response_cache.put(key, {"response": "stale"}, age=120)
+
+    assert api.call_backend(URL, PAYLOAD, allow_stale=False) == ({"response": 1}, None)
+    assert len(backend) == 1
+
+
+def test_failed_revalidation_keeps_the_stale_entry(backend, monkeypatch):
+    monkeypatch.setattr(api, "fetch", lambda api_url, payload: (None, "backend down"))
+    key = api.payload_fingerprint(URL, PAYLOAD)
+    api.response_cache.put(key, {"response": "stale"}, age=120)
+    failed = api.revalidation_counts["failed"]
+
+    assert api.call_backend(URL, PAYLOAD) == ({"response": "stale"}, None)
+    _wait_for_revalidation()
+
+    assert api.revalidation_counts["failed"] == failed + 1
+    assert api.call_backend(URL, PAYLOAD) == ({"response": "stale"}, None)
@@ -0,0 +1,54 @@
+import batch_estimate
+from common.query_params import read_filters
+
+API_URL = "http://backend/get-price-per-square-meters/"
+
+
+def _task(row, read_error=None):
+    return 1, row, read_error, API_URL, False
+
+
+def test_read_filters_reports_bad_json_lines_and_goes_on(tmp_path):
+    path = tmp_path / "filters.jsonl"
+    path.write_text('{"postal_code": "00100"}\n{not json\n\n[1, 2]\n', encoding="utf-8")
+
+    rows = list(read_filters(str(path)))
+
+    assert rows[0] == ({"postal_code": "00100"}, None)
+    assert rows[1][0] is None and rows[1][1].startswith("Invalid JSON")
+    assert rows[2] == ([1, 2], None)
+
+
+def test_read_filters_reads_csv(tmp_path):
+    path = tmp_path / "filters.csv"
+    path.write_text("postal_code,start_year\n00100,1970\n", encoding="utf-8")
+    assert list(read_filters(str(path))) == [({"postal_code": "00100", "start_year": "1970"}, None)]
+
+
+def test_unreadable_and_non_object_rows_get_an_error():
+    assert batch_estimate.estimate(_task(None, "Invalid JSON: oops")) == {"row": 1, "error": "Invalid JSON: oops"}
+    assert "Expected an object" in batch_estimate.estimate(_task([1, 2]))["error"]
+
+
+def test_malformed_parameters_get_an_error():
+    result = batch_estimate.estimate(_task({"start_year": "19x5"}))
+    assert result["error"].startswith("Invalid query parameters")
+
+
+def test_unexpected_backend_response_gets_an_error(monkeypatch):
+    monkeypatch.setattr(batch_estimate, "call_backend", lambda api_url, payload, allow_stale: ({"mean": 1.0}, None))
+    result = batch_estimate.estimate(_task({"postal_code": "00100"}))
+    assert result["postal_code"] == "00100"
+    assert result["error"] == "Estimation failed: KeyError: 'transactions'"
+
+
+def test_estimates_a_valid_row(monkeypatch):
+    response = {
+        "min_prices_per_square_meter": [3000.0] * 6,
+        "max_prices_per_square_meter": [3200.0] * 6,
+        "transactions": [1] * 6,
+    }
+    monkeypatch.setattr(batch_estimate, "call_backend", lambda api_url, payload, allow_stale: (response, None))
+    result = batch_estimate.estimate(_task({"postal_code": "00100"}))
+    assert "error" not in result
+    assert (result["sample_size"], result["median"]) == (6, 3100.0)
@@ -0,0 +1,67 @@
+from common.cache import TTLCache
+
+
+def test_lru_eviction():
+    cache = TTLCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_the_ttl():
+    cache = TTLCache(10, ttl_seconds=60)
+    cache.put("fresh", 1, age=59)
+    cache.put("expired", 2, age=61)
+
+    assert cache.get("fresh") == 1
+    assert cache.get("expired", "default") == "default"
+    assert len(cache) == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["hit_rate"]) == (1, 1, 1, 0.5)
+
+
+def test_without_a_ttl_entries_only_leave_by_eviction():
+    cache = TTLCache(10)
+    cache.put("old", 1, age=10 ** 9)
+    assert cache.get("old") == 1
+    cache.clear()
+    assert cache.get("old") is None
+
+
+def test_put_replaces_and_refreshes_an_entry():
+    cache = TTLCache(2, ttl_seconds=60)
+    cache.put("a", 1, age=120)
+    cache.put("b", 2)
+    cache.put("a", 3)
+    cache.put("c", 4)
+    # The replaced entry is fresh and most recently used again, so b was evicted
+    assert cache.get("a") == 3
+    assert cache.get("b") is None
+
+
+def test_stale_window():
+    cache = TTLCache(10, ttl_seconds=60, stale_seconds=600)
+    cache.put("fresh", 1, age=30)
+    cache.put("stale", 2, age=120)
+    cache.put("gone", 3, age=700)
+
+    assert cache.get_entry("fresh")[::2] == (1, False)
+    assert cache.get_entry("stale")[::2] == (2, True)
+    assert cache.get_entry("gone") is None
+    assert "gone" not in cache._entries
+    # Plain get and peek never return stale entries
+    assert cache.get("stale") is None
+    assert cache.peek("stale") is None
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_peek_does_not_count_lookups():
+    cache = TTLCache(10, ttl_seconds=60)
+    cache.put("a", 1)
+    assert cache.peek("a") == 1
+    assert cache.peek("b", "default") == "default"
+    assert (cache.hits, cache.misses) == (0, 0)
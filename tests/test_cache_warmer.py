@@ -0,0 +1,24 @@
+from common import cache_warmer
+
+API_URL = "http://backend/get-price-per-square-meters/"
+
+
+def test_malformed_queries_fail_alone(monkeypatch):
+    import common.api
+
+    monkeypatch.setattr(common.api, "refresh_backend", lambda api_url, payload, max_age=None: ({"counts": []}, None))
+    queries = [
+        {"cities": "helsinki", "start_year": "1965", "end_year": "1985"},
+        {"cities": "helsinki", "start_year": "19x5"},
+        {"postal_code": "123"},
+    ]
+
+    stats = cache_warmer.warm_cache(queries, API_URL, max_workers=2)
+
+    assert (stats["queries"], stats["warmed"], stats["failed"]) == (3, 1, 2)
+    assert stats["coverage"] == 1 / 3
+    assert stats["last_duration_seconds"] is not None
+
+
+def test_warm_query_returns_the_error():
+    assert cache_warmer.warm_query(API_URL, {"min_m2": "abc"}).startswith("Invalid query parameters")
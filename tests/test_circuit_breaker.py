@@ -0,0 +1,81 @@
+import pytest
+
+from common import circuit_breaker
+from common.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return clock
+
+
+def _open_breaker():
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window_seconds=30, open_seconds=15)
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success)
+    return breaker
+
+
+def test_opens_at_the_failure_rate(clock):
+    breaker = _open_breaker()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+    assert breaker.retry_in() == 15
+
+
+def test_stays_closed_below_min_calls_or_the_failure_rate(clock):
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4)
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state == CLOSED
+
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4)
+    for success in (True, True, True, False):
+        breaker.record(success)
+    assert breaker.state == CLOSED
+
+
+def test_old_outcomes_leave_the_window(clock):
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window_seconds=30)
+    for _ in range(3):
+        breaker.record(False)
+    clock.now += 31
+    breaker.record(False)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success(clock):
+    breaker = _open_breaker()
+    clock.now += 15
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+    assert breaker.stats()["failure_share"] == 0.0
+
+
+def test_failed_probe_opens_it_again(clock):
+    breaker = _open_breaker()
+    clock.now += 15
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert breaker.stats()["opened"] == 2
+    assert not breaker.allow()
+    clock.now += 15
+    assert breaker.allow()
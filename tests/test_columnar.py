@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from common.columnar import ColumnarFormatError, decode_columns, encode_columns, is_columnar
+
+
+def _columns():
+    return {
+        "min_price_per_square_meter": np.array([1500.0, 2750.5, 4100.25]),
+        "transactions": np.array([3, 1, 12], dtype=np.int64),
+        "year_built": np.array([1965, 2010, 1890], dtype=np.uint16),
+        "ratio": np.array([0.5, 1.5, 2.5], dtype=np.float32),
+    }
+
+
+def test_round_trip_keeps_values_dtypes_and_order():
+    columns = _columns()
+    decoded = decode_columns(encode_columns(columns))
+    assert list(decoded) == list(columns)
+    for name, values in columns.items():
+        assert decoded[name].dtype == values.dtype.newbyteorder("<")
+        np.testing.assert_array_equal(decoded[name], values)
+
+
+def test_lists_big_endian_and_empty_columns():
+    decoded = decode_columns(
+        encode_columns({"a": [1, 2, 3], "b": np.array([1.5, 2.5], dtype=">f8"), "c": np.zeros(0, dtype=np.int32)})
+    )
+    np.testing.assert_array_equal(decoded["a"], [1, 2, 3])
+    assert decoded["b"].dtype == np.dtype("<f8")
+    np.testing.assert_array_equal(decoded["b"], [1.5, 2.5])
+    assert len(decoded["c"]) == 0
+
+
+def test_columns_are_padded_read_only_views():
+    body = encode_columns(_columns())
+    assert len(body) % 8 == 0
+    for values in decode_columns(body).values():
+        assert not values.flags.writeable
+
+
+def test_unsupported_dtypes_are_rejected():
+    with pytest.raises(ColumnarFormatError):
+        encode_columns({"city": np.array(["helsinki", "espoo"])})
+    with pytest.raises(ColumnarFormatError):
+        encode_columns({"mixed": [1, None]})
+
+
+@pytest.mark.parametrize("length", [0, 5, 11, 12, 40, -8, -5])
+def test_truncated_bodies_fail(length):
+    body = encode_columns(_columns())
+    with pytest.raises(ColumnarFormatError):
+        decode_columns(body[:length])
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"JSON\x01\x00\x00\x00\x00\x00\x00\x00",
+        b"COLS\x02\x00\x00\x00\x00\x00\x00\x00",
+        b"COLS\x01\x00\x00\x00\x04\x00\x00\x00{}  ",
+        b"COLS\x01\x00\x00\x00\x08\x00\x00\x00not json",
+        b'COLS\x01\x00\x00\x00\x10\x00\x00\x00{"columns":[1]}',
+        b'COLS\x01\x00\x00\x00\x30\x00\x00\x00{"columns":[{"name":"a","dtype":"<q","length":2}]}',
+    ],
+)
+def test_malformed_bodies_fail(body):
+    with pytest.raises(ColumnarFormatError):
+        decode_columns(body)
+
+
+def test_is_columnar():
+    assert is_columnar({"a": [1, 2], "b": np.arange(3)})
+    assert not is_columnar({})
+    assert not is_columnar({"a": [1, 2], "count": 2})
+    assert not is_columnar({"a": np.zeros((2, 2))})
@@ -0,0 +1,107 @@
+import sqlite3
+
+import numpy as np
+
+from common.disk_cache import DiskCache
+
+
+def test_round_trips_json_and_columns(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), 1 << 20, version="v1")
+    cache.put("json", {"estimate": 4200.5, "rows": [1, 2]})
+    cache.put("columns", {"price": np.arange(5, dtype=np.float64)})
+
+    assert cache.get("json") == {"estimate": 4200.5, "rows": [1, 2]}
+    np.testing.assert_array_equal(cache.get("columns")["price"], np.arange(5))
+    assert cache.get("missing") is None
+    assert cache.stats()["hits"] == 2
+
+
+def test_dataset_versions_do_not_see_or_delete_each_other(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    old = DiskCache(path, 1 << 20, version="v1")
+    new = DiskCache(path, 1 << 20, version="v2")
+    old.put("key", {"data": "old"})
+    new.put("key", {"data": "new"})
+
+    assert new.get("key") == {"data": "new"}
+    assert old.get("key") == {"data": "old"}
+    assert DiskCache(path, 1 << 20, version="v3").get("key") is None
+    assert old.get("key") == {"data": "old"}
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), 1 << 20, ttl_seconds=-1, version="v1")
+    cache.put("key", {"data": "value"})
+    assert cache.get_entry("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_evicts_other_versions_first_then_least_recently_used(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    # About 1 kB each once encoded, so the cache holds three of them
+    response = {"data": "x" * 1000}
+    DiskCache(path, 1 << 20, version="v1").put("old", response)
+    cache = DiskCache(path, 3500, version="v2")
+    cache.put("a", response)
+    cache.put("b", response)
+    assert DiskCache(path, 1 << 20, version="v1").get("old") == response
+
+    cache.put("c", response)
+    assert DiskCache(path, 1 << 20, version="v1").get("old") is None
+    assert cache.get("a") == response
+
+    cache.put("d", response)
+    assert cache.get("a") is None
+    assert cache.get("d") == response
+    assert cache.stats()["evictions"] == 2
+
+
+def test_unavailable_file_is_a_miss(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = DiskCache(str(blocker / "cache.sqlite"), 1 << 20, version="v1")
+    cache.put("key", {"data": "value"})
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_leases_elect_one_owner(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = DiskCache(path, 1 << 20)
+    second = DiskCache(path, 1 << 20)
+    assert first.acquire_lease("job", 60)
+    assert not second.acquire_lease("job", 60)
+    assert first.acquire_lease("job", 60)
+    assert second.acquire_lease("other", 60)
+
+
+def test_files_of_an_older_schema_are_recreated(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, stored_at REAL, value BLOB)")
+    connection.execute("INSERT INTO entries VALUES ('key', 0, x'00')")
+    connection.execute("PRAGMA user_version = 1")
+    connection.commit()
+    connection.close()
+
+    cache = DiskCache(path, 1 << 20, version="v1")
+    assert cache.get("key") is None
+    cache.put("key", {"data": "value"})
+    assert cache.get("key") == {"data": "value"}
+    assert cache.stats()["errors"] == 0
+
+
+def test_reopens_after_the_backoff(tmp_path):
+    blocker = tmp_path / "cache"
+    blocker.write_text("")
+    cache = DiskCache(str(blocker / "cache.sqlite"), 1 << 20, version="v1")
+    cache.put("key", {"data": "value"})
+    assert cache._unavailable()
+
+    # The disk is fixed, but nothing is tried again until the backoff has passed
+    blocker.unlink()
+    cache.put("key", {"data": "value"})
+    assert not blocker.exists()
+    cache._reopen_at = 0.0
+    cache.put("key", {"data": "value"})
+    assert cache.get("key") == {"data": "value"}
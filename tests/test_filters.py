@@ -0,0 +1,98 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from common.filters import Filter, FilterError, build_filter, in_filter, process_postal_codes, range_filter
+from common.local_engine import TransactionSnapshot
+from common.synthetic import generate_transactions
+
+FILTER_COLUMNS = ("postal_code", "city", "plot_ownership", "room_category", "building_type", "state", "year_built", "square_meters")
+
+
+@pytest.fixture(scope="module")
+def arrays():
+    return generate_transactions(3000, seed=5)
+
+
+@pytest.fixture(scope="module")
+def database(arrays):
+    connection = sqlite3.connect(":memory:")
+    connection.execute(f"CREATE TABLE transactions (row INTEGER, {', '.join(FILTER_COLUMNS)})")
+    rows = zip(range(len(arrays["transactions"])), *(arrays[column].tolist() for column in FILTER_COLUMNS))
+    connection.executemany(f"INSERT INTO transactions VALUES ({', '.join('?' * (len(FILTER_COLUMNS) + 1))})", rows)
+    yield connection
+    connection.close()
+
+
+def _random_filters(arrays, count):
+    rng = np.random.default_rng(0)
+    codes = np.unique(arrays["postal_code"])
+    for i in range(count):
+        start_year = int(rng.integers(1900, 2020))
+        min_square_meters = float(rng.integers(10, 100)) + (0.5 if i % 2 else 0.0)
+        options = {
+            column: list(rng.choice(np.unique(arrays[column]), rng.integers(0, 3), replace=False))
+            for column in ("city", "plot_ownership", "room_category", "building_type", "state")
+        }
+        query_filter, error = build_filter(
+            ",".join(rng.choice(codes, rng.integers(1, 20), replace=False)) if i % 3 else "",
+            (start_year, start_year + int(rng.integers(0, 60))),
+            (min_square_meters, min_square_meters + float(rng.integers(0, 120))),
+            options["city"],
+            options["plot_ownership"],
+            options["room_category"],
+            options["building_type"],
+            options["state"],
+            process_postal_codes,
+        )
+        assert error is None
+        yield query_filter
+
+
+def test_where_clause_round_trips(arrays):
+    for query_filter in _random_filters(arrays, 100):
+        where_clause = query_filter.to_where_clause()
+        parsed = Filter.from_where_clause(where_clause)
+        assert parsed == query_filter
+        assert parsed.fingerprint() == query_filter.fingerprint()
+        assert parsed.to_where_clause() == where_clause
+
+
+def test_mask_matches_the_sql(arrays, database):
+    snapshot = TransactionSnapshot.from_arrays(arrays)
+    disjoint = Filter([in_filter("city", ["espoo"]), in_filter("city", ["vantaa"]), range_filter("year_built", 1950)])
+    for query_filter in [*_random_filters(arrays, 100), disjoint]:
+        sql = "SELECT row FROM transactions WHERE " + " AND ".join(query_filter.to_where_clause())
+        expected = sorted(row for (row,) in database.execute(sql))
+        assert np.flatnonzero(query_filter.to_mask(snapshot)).tolist() == expected, sql
+
+
+def test_fingerprint_ignores_order_synonyms_and_redundant_bounds():
+    canonical = Filter.from_where_clause([
+        "postal_code in ('00100', '00200')",
+        "year_built >= 1965",
+        "year_built <= 1985",
+        "room_category in ('Kaksi huonetta', 'Kaksiot')",
+    ])
+    equivalent = Filter.from_where_clause([
+        "room_category in ('Kaksiot')",
+        "year_built <= 1985.0",
+        "postal_code in ('00200', '00100', '00100')",
+        "year_built >= 1900",
+        "year_built >= 1965",
+    ])
+    assert equivalent == canonical
+    assert equivalent.fingerprint() == canonical.fingerprint()
+    assert Filter.from_where_clause(["year_built >= 1966"]).fingerprint() != canonical.fingerprint()
+
+
+def test_disjoint_sets_match_nothing():
+    query_filter = Filter([in_filter("city", ["espoo"]), in_filter("city", ["vantaa"])])
+    assert query_filter.to_where_clause() == ["city in (NULL)"]
+    assert Filter.from_where_clause(query_filter.to_where_clause()) == query_filter
+
+
+def test_unsupported_fragments_are_rejected():
+    with pytest.raises(FilterError):
+        Filter.from_where_clause(["city = 'espoo'"])
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from common.filters import build_filter, process_postal_codes
+from common.local_engine import LocalEngine, TransactionSnapshot
+from common.synthetic import generate_transactions
+
+
+@pytest.fixture(scope="module")
+def arrays():
+    return generate_transactions(30_000, seed=6)
+
+
+def _random_where_clauses(arrays, count):
+    rng = np.random.default_rng(1)
+    codes = np.unique(arrays["postal_code"])
+    for i in range(count):
+        start_year = int(rng.integers(1880, 2024))
+        min_square_meters = float(rng.integers(0, 150)) + (0.5 if i % 2 else 0.0)
+        options = {
+            column: list(rng.choice(np.unique(arrays[column]), rng.integers(0, 3), replace=False))
+            for column in ("city", "plot_ownership", "room_category", "building_type", "state")
+        }
+        query_filter, _ = build_filter(
+            ",".join(rng.choice(codes, rng.integers(1, 40), replace=False)) if i % 3 else "",
+            (start_year, start_year + int(rng.integers(0, 80))),
+            (min_square_meters, min_square_meters + float(rng.integers(0, 200))),
+            options["city"],
+            options["plot_ownership"],
+            options["room_category"],
+            options["building_type"],
+            options["state"],
+            process_postal_codes,
+        )
+        where_clause = query_filter.to_where_clause()
+        # Columns without an index are scanned
+        if i % 5 == 0:
+            where_clause.append(f"min_price_per_square_meter >= {int(rng.integers(1000, 6000))}")
+        yield where_clause
+
+
+def test_index_matches_the_full_scan(arrays):
+    snapshot = TransactionSnapshot.from_arrays(arrays)
+    indexed = LocalEngine(snapshot)
+    scanned = LocalEngine(snapshot, build_index=False)
+    matched = 0
+    for where_clause in _random_where_clauses(arrays, 400):
+        rows = indexed.row_ids(where_clause)
+        np.testing.assert_array_equal(rows, scanned.row_ids(where_clause), err_msg=str(where_clause))
+        matched += len(rows) > 0
+    # The filters exercise both the selective and the bitmap plan, not only empty results
+    assert matched > 100
+    assert len(indexed.row_ids(["year_built >= 1880"])) == snapshot.num_rows
+
+
+def test_empty_snapshot(arrays):
+    snapshot = TransactionSnapshot.from_arrays({name: values[:0] for name, values in arrays.items()})
+    engine = LocalEngine(snapshot)
+    for where_clause in (
+        [],
+        ["city in ('helsinki')", "year_built >= 1965"],
+        ["min_price_per_square_meter >= 3000"],
+        ["min_price_per_square_meter >= 3000", "square_meters <= 85"],
+    ):
+        assert len(engine.row_ids(where_clause)) == 0
+    assert engine.property_price_valuation([])["sample_size"] == 0
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from scipy.stats import gaussian_kde
+
+from common.kde import KDE_GRID_POINTS, binned_kde, kde_figure, select_bandwidth
+
+
+def _samples(seed):
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([rng.normal(3000, 400, 600), rng.normal(5500, 900, 400)])
+    weights = rng.integers(1, 10, len(values)).astype(np.float64)
+    return values, weights
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_bandwidth_matches_scipy(weighted):
+    values, weights = _samples(0)
+    weights = weights if weighted else None
+    expected = gaussian_kde(values, weights=weights).factor * np.sqrt(np.cov(values, aweights=weights))
+    assert select_bandwidth(values, weights) == pytest.approx(expected, rel=1e-9)
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_binned_kde_matches_scipy(weighted):
+    values, weights = _samples(1)
+    weights = weights if weighted else None
+
+    grid, density = binned_kde(values, weights)
+
+    exact = gaussian_kde(values, weights=weights)(grid)
+    assert np.max(np.abs(density - exact)) < 1e-3 * exact.max()
+
+
+def test_binned_kde_of_identical_values_is_a_bump():
+    grid, density = binned_kde(np.full(10, 2500.0))
+    assert grid[np.argmax(density)] == pytest.approx(2500.0, abs=grid[1] - grid[0])
+    assert np.all(density >= 0)
+
+
+def test_binned_kde_has_the_mass_of_the_exact_kde():
+    # The grid ends at the smallest and largest value, like create_distplot's, so the tails are left out
+    values, weights = _samples(2)
+    grid, density = binned_kde(values, weights)
+    exact_mass = np.trapezoid(gaussian_kde(values, weights=weights)(grid), grid)
+    assert np.trapezoid(density, grid) == pytest.approx(exact_mass, abs=1e-3)
+
+
+def test_small_samples_keep_the_exact_distplot_and_large_ones_the_binned_curve():
+    values, _ = _samples(3)
+    small = kde_figure(values[:50], exact_max_samples=100)
+    large = kde_figure(values, exact_max_samples=100)
+
+    exact_density = gaussian_kde(values[:50])(np.asarray(small.data[0].x))
+    np.testing.assert_allclose(small.data[0].y, exact_density, rtol=1e-6)
+    assert len(large.data) == 1
+    assert len(large.data[0].x) == KDE_GRID_POINTS
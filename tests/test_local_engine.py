@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from common.local_engine import VALUATION_WINDOW_YEARS, LocalEngine, TransactionSnapshot
+from common.synthetic import generate_transactions
+
+VALUATION_WHERE_CLAUSE = ["year_built >= 1950", "year_built <= 2020", "square_meters >= 20", "square_meters <= 120"]
+
+
+def _valuation_rows(arrays):
+    keep = (
+        (arrays["year_built"] >= 1950)
+        & (arrays["year_built"] <= 2020)
+        & (arrays["square_meters"] >= 20)
+        & (arrays["square_meters"] <= 120)
+    )
+    return keep & (arrays["sale_year"] >= arrays["sale_year"].max() - VALUATION_WINDOW_YEARS)
+
+
+# A snapshot generated years ago is what a fixed snapshot looks like once the clock has moved forward
+@pytest.mark.parametrize("reference_year", [2000, 2024, 2090])
+def test_valuation_window_follows_the_snapshot_not_the_clock(reference_year):
+    arrays = generate_transactions(5000, seed=2, reference_year=reference_year)
+    engine = LocalEngine(TransactionSnapshot.from_arrays(arrays))
+
+    valuation = engine.property_price_valuation(VALUATION_WHERE_CLAUSE)
+
+    keep = _valuation_rows(arrays)
+    assert valuation["sample_size"] == arrays["transactions"][keep].sum() > 0
+    assert valuation["mean"] == pytest.approx(np.average(arrays["price"][keep], weights=arrays["transactions"][keep]))
+
+
+def test_valuation_without_sale_years_uses_every_row():
+    arrays = generate_transactions(1000, seed=2)
+    del arrays["sale_year"]
+    engine = LocalEngine(TransactionSnapshot.from_arrays(arrays))
+    assert engine.latest_sale_year is None
+    assert engine.property_price_valuation([])["sample_size"] == arrays["transactions"].sum()
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from common.single_flight import SingleFlight
+
+
+def test_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow))) for _ in range(5)]
+    threads[0].start()
+    while flight.in_flight() == 0:
+        pass
+    for thread in threads[1:]:
+        thread.start()
+    while flight.stats()["coalesced"] < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "executed": 1, "coalesced": 4}
+
+
+def test_shares_exceptions_and_runs_again_afterwards():
+    flight = SingleFlight()
+
+    def failing():
+        raise RuntimeError("backend down")
+
+    with pytest.raises(RuntimeError):
+        flight.do("key", failing)
+    assert flight.do("key", lambda: "ok") == "ok"
+    assert flight.stats()["executed"] == 2
+
+
+def test_different_keys_run_concurrently():
+    flight = SingleFlight()
+    both_started = threading.Barrier(2, timeout=5)
+
+    def call():
+        # Only returns once the other key's call is running too
+        both_started.wait()
+        return "result"
+
+    results = {}
+    threads = [
+        threading.Thread(target=lambda key=key: results.update({key: flight.do(key, call)})) for key in ("a", "b")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": "result", "b": "result"}
+    assert flight.stats() == {"in_flight": 0, "executed": 2, "coalesced": 0}
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from common.filters import build_filter, process_postal_codes
+from common.local_engine import LocalEngine, TransactionSnapshot
+from common.sketches import QuantileSketch, quantile_rank_errors
+from common.statistics import summarize_histogram
+from common.synthetic import generate_transactions
+
+
+@pytest.fixture(scope="module")
+def snapshot():
+    return TransactionSnapshot.from_arrays(generate_transactions(20_000, seed=3))
+
+
+@pytest.fixture(scope="module")
+def engines(snapshot):
+    return LocalEngine(snapshot, build_sketch_cube=True), LocalEngine(snapshot)
+
+
+def _where_clause(postal_codes="", years=(1965, 1985), square_meters=(25, 85), rooms=(), ownership=()):
+    query_filter, error = build_filter(
+        postal_codes, years, square_meters, [], list(ownership), list(rooms), [], [], process_postal_codes
+    )
+    assert error is None
+    return query_filter.to_where_clause()
+
+
+def _random_where_clauses(snapshot, count):
+    rng = np.random.default_rng(0)
+    codes = list(snapshot.categories["postal_code"])
+    for i in range(count):
+        start_year = int(rng.integers(1900, 2020))
+        min_square_meters = float(rng.integers(10, 100)) + (0.5 if i % 2 else 0.0)
+        yield _where_clause(
+            ",".join(rng.choice(codes, rng.integers(1, 30), replace=False)) if i % 4 else "",
+            (start_year, start_year + int(rng.integers(0, 60))),
+            (min_square_meters, min_square_meters + float(rng.integers(0, 120))),
+            rng.choice(["Yksiö", "Kaksiot", "Kolmiot"], rng.integers(0, 3), replace=False),
+        )
+
+
+def test_histogram_matches_the_exact_rows(snapshot, engines):
+    cube_engine, exact_engine = engines
+    for where_clause in _random_where_clauses(snapshot, 150):
+        from_cube = cube_engine.price_histogram(where_clause)
+        exact = exact_engine.price_histogram(where_clause)
+        assert from_cube["count"] == exact["count"], where_clause
+        if exact["count"] == 0:
+            continue
+        for key in ("mean", "variance", "effective_sample_size", "min", "max"):
+            assert from_cube[key] == pytest.approx(exact[key], rel=1e-9), (key, where_clause)
+        cube_summary = summarize_histogram(from_cube)
+        exact_summary = summarize_histogram(exact)
+        for key in ("q25", "median", "q75"):
+            assert abs(getattr(cube_summary, key) - getattr(exact_summary, key)) <= exact["bin_width"]
+
+
+def test_partly_covered_buckets_are_not_over_counted(snapshot, engines):
+    cube_engine, exact_engine = engines
+    # Neither range falls on a bucket edge, and the second one fits no whole bucket
+    for square_meters in ((27.5, 83.2), (72.5, 76.5)):
+        where_clause = _where_clause(years=(1963, 1987), square_meters=square_meters)
+        summary = cube_engine.price_summary(where_clause)
+        assert summary["source"] == "sketch"
+        assert summary["edge_rows"] > 0
+        assert summary["count"] == exact_engine.price_summary(where_clause)["count"]
+
+
+def test_filters_on_other_columns_use_the_exact_rows(engines):
+    cube_engine, exact_engine = engines
+    where_clause = _where_clause(ownership=["oma"])
+    assert cube_engine.price_summary(where_clause)["source"] == "exact"
+    from_cube = cube_engine.price_histogram(where_clause)
+    exact = exact_engine.price_histogram(where_clause)
+    np.testing.assert_array_equal(from_cube["counts"], exact["counts"])
+
+
+def test_compressed_cells_stay_within_the_rank_error():
+    # Two postal codes, one kind of apartment and narrow ranges, so the cells hold over a thousand rows each
+    arrays = generate_transactions(50_000, seed=4)
+    arrays["postal_code"] = np.where(np.arange(50_000) % 2, "00100", "00200")
+    arrays["city"] = np.full(50_000, "helsinki")
+    arrays["building_type"] = np.full(50_000, "kt")
+    arrays["room_category"] = np.full(50_000, "Kaksiot")
+    arrays["year_built"] = 1960 + arrays["year_built"] % 20
+    arrays["square_meters"] = 40 + arrays["square_meters"] % 20
+    engine = LocalEngine(TransactionSnapshot.from_arrays(arrays), build_sketch_cube=True)
+    assert engine.sketch_cube.cell_compressed.any()
+
+    where_clause = _where_clause("00100,00200", years=(1962, 1979), square_meters=(41.5, 60))
+    summary = engine.price_summary(where_clause)
+    assert summary["edge_rows"] > 0
+    assert max(engine.sketch_error(where_clause).values()) < 0.005
+
+
+def test_merged_sketches_match_the_quantiles_of_all_values():
+    rng = np.random.default_rng(1)
+    parts = [rng.lognormal(8, 0.3, 5000) for _ in range(8)]
+    merged = QuantileSketch.merge_all(QuantileSketch.from_values(part) for part in parts)
+    values = np.concatenate(parts)
+
+    assert merged.count == len(values)
+    assert (merged.min, merged.max) == (values.min(), values.max())
+    quantiles = dict(zip((0.25, 0.5, 0.75), merged.quantiles([0.25, 0.5, 0.75])))
+    errors = quantile_rank_errors(quantiles, values, np.ones(len(values)))
+    assert max(errors.values()) < 0.005
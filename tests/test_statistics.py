@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.statistics import price_histogram, price_midpoints, summarize_histogram, summarize_prices, weighted_quantiles
+
+QUANTILES = [0.0, 0.05, 0.25, 0.5, 0.75, 0.95, 1.0]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_weighted_quantiles_match_repeated_values(seed):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(4000, 1500, 200).round()
+    weights = rng.integers(1, 20, 200)
+
+    results, minimum, maximum = weighted_quantiles(values, weights.astype(np.float64), QUANTILES)
+
+    repeated = pd.Series(np.repeat(values, weights))
+    np.testing.assert_allclose(results, repeated.quantile(QUANTILES).to_numpy())
+    assert minimum == repeated.min()
+    assert maximum == repeated.max()
+
+
+def test_weighted_quantiles_with_ties_and_a_single_value():
+    values = np.array([3.0, 1.0, 3.0, 2.0])
+    weights = np.array([2.0, 1.0, 1.0, 3.0])
+    results, _, _ = weighted_quantiles(values, weights, QUANTILES)
+    np.testing.assert_allclose(results, pd.Series(np.repeat(values, weights.astype(int))).quantile(QUANTILES))
+
+    results, minimum, maximum = weighted_quantiles(np.array([5.0]), np.array([4.0]), QUANTILES)
+    np.testing.assert_allclose(results, 5.0)
+    assert minimum == maximum == 5.0
+
+
+def test_weighted_summary_matches_the_repeated_transactions():
+    rng = np.random.default_rng(7)
+    min_prices = rng.normal(3500, 800, 300).round()
+    max_prices = min_prices + rng.integers(0, 300, 300)
+    transactions = rng.integers(0, 6, 300)
+
+    summary = summarize_prices(min_prices, max_prices, transactions)
+    expanded = summarize_prices(np.repeat(min_prices, transactions), np.repeat(max_prices, transactions))
+
+    assert summary.count == expanded.count == transactions.sum()
+    for field in ("mean", "median", "q25", "q75", "min", "max"):
+        assert getattr(summary, field) == pytest.approx(getattr(expanded, field)), field
+    # Price groups without sales are left out
+    assert len(summary.midpoints) == np.count_nonzero(transactions)
+
+
+def test_single_transactions_are_unweighted():
+    summary = summarize_prices([1000, 2000], [1200, 2200], [1, 1])
+    assert summary.weights is None
+    assert (summary.count, summary.mean) == (2, 1600.0)
+
+
+def test_summary_of_no_sales_fails():
+    with pytest.raises(ValueError):
+        summarize_prices([1000], [1200], [0])
+
+
+@pytest.mark.parametrize(
+    "seed, weighted, bin_width, max_bins",
+    [(0, False, 50.0, 400), (1, True, 50.0, 400), (2, True, 10.0, 400), (3, True, 50.0, 20)],
+)
+def test_histogram_summary_matches_the_exact_summary(seed, weighted, bin_width, max_bins):
+    rng = np.random.default_rng(seed)
+    min_prices = rng.lognormal(8.2, 0.4, 2000).round()
+    max_prices = min_prices + rng.integers(0, 300, 2000)
+    transactions = rng.integers(0, 6, 2000) if weighted else None
+
+    exact = summarize_prices(min_prices, max_prices, transactions)
+    histogram = price_histogram(price_midpoints(min_prices, max_prices), transactions, bin_width, max_bins)
+    summary = summarize_histogram(histogram)
+
+    assert len(histogram["counts"]) <= max_bins
+    assert histogram["counts"].sum() == summary.count == exact.count
+    assert (summary.min, summary.max) == (exact.min, exact.max)
+    assert summary.mean == pytest.approx(exact.mean)
+    # Bins are widened rather than exceed max_bins, and quantiles are only known to within a bin
+    assert histogram["bin_width"] >= bin_width
+    for field in ("q25", "median", "q75"):
+        assert abs(getattr(summary, field) - getattr(exact, field)) <= histogram["bin_width"], field
+
+
+def test_histogram_of_no_sales():
+    histogram = price_histogram([1000.0, 2000.0], [0, 0])
+    assert histogram["count"] == 0
+    with pytest.raises(ValueError):
+        summarize_histogram(histogram)